@@ -0,0 +1,34 @@
+"""Add product version
+
+Revision ID: 7c1d2e9f4a6b
+Revises: 49e15e8094b1
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1d2e9f4a6b'
+down_revision: Union[str, None] = '49e15e8094b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence('products_version_seq')))
+    op.add_column('products', sa.Column(
+        'version', sa.BigInteger(),
+        server_default=sa.text("nextval('products_version_seq')"),
+        nullable=False))
+    op.create_index(op.f('ix_products_version'), 'products', ['version'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_products_version'), table_name='products')
+    op.drop_column('products', 'version')
+    op.execute(sa.schema.DropSequence(sa.Sequence('products_version_seq')))
@@ -0,0 +1,35 @@
+"""Add product stock shards
+
+Revision ID: 3f8a5b7c9d21
+Revises: 7c1d2e9f4a6b
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f8a5b7c9d21'
+down_revision: Union[str, None] = '7c1d2e9f4a6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'product_stock_shards',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('shard', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Integer(), nullable=False),
+        sa.CheckConstraint('amount >= 0', name='check_shard_amount'),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('product_stock_shards')
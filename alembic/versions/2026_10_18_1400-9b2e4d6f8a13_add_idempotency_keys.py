@@ -0,0 +1,40 @@
+"""Add idempotency keys
+
+Revision ID: 9b2e4d6f8a13
+Revises: 3f8a5b7c9d21
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b2e4d6f8a13'
+down_revision: Union[str, None] = '3f8a5b7c9d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('response', postgresql.JSONB(astext_type=sa.Text()),
+                  nullable=False),
+        sa.Column('created_at', sa.DateTime(),
+                  server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_idempotency_keys_created_at'),
+                    'idempotency_keys', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_idempotency_keys_created_at'),
+                  table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
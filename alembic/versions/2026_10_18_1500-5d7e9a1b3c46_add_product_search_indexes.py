@@ -0,0 +1,42 @@
+"""Add product search indexes
+
+Revision ID: 5d7e9a1b3c46
+Revises: 9b2e4d6f8a13
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d7e9a1b3c46'
+down_revision: Union[str, None] = '9b2e4d6f8a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Хранимая колонка перезаписывает таблицу products целиком.
+    op.add_column('products', sa.Column(
+        'search_document', postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple'::regconfig, "
+                    "name || ' ' || coalesce(description, ''))",
+                    persisted=True)))
+    op.create_index('ix_products_search_document', 'products',
+                    ['search_document'], postgresql_using='gin')
+    # Без pg_trgm поиск по подстроке просматривал бы всю таблицу,
+    # поэтому расширение обязательно.
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_products_name_trgm', 'products', ['name'],
+                    postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_name_trgm', table_name='products')
+    op.drop_index('ix_products_search_document', table_name='products')
+    op.drop_column('products', 'search_document')
@@ -0,0 +1,27 @@
+"""Add order_items product_id index
+
+Revision ID: 8a4c6e2f1b57
+Revises: 5d7e9a1b3c46
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a4c6e2f1b57'
+down_revision: Union[str, None] = '5d7e9a1b3c46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_order_items_product_id'), 'order_items',
+                    ['product_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_order_items_product_id'),
+                  table_name='order_items')
@@ -0,0 +1,26 @@
+"""Add orders status created_at index
+
+Revision ID: 2e6b8d0f3a79
+Revises: 8a4c6e2f1b57
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e6b8d0f3a79'
+down_revision: Union[str, None] = '8a4c6e2f1b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_orders_status_created_at', 'orders',
+                    ['status', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_status_created_at', table_name='orders')
@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import dataclasses
+import sys
+from pathlib import Path
+
+from app.core.config import settings
+from app.core.models.bulk import FORMATS, import_products, export_products
+from app.core.models.database import sessionmanager
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def detect_format(path: str, file_format: str = None) -> str:
+    if file_format:
+        return file_format
+    return 'ndjson' if Path(path).suffix in ('.ndjson', '.jsonl') else 'csv'
+
+
+async def read_chunks(path: str):
+    with open(path, 'rb') as file:
+        while chunk := file.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def run_import(path: str, file_format: str):
+    async with sessionmanager.session() as session:
+        rows = await import_products(
+            db=session, chunks=read_chunks(path), file_format=file_format)
+        await session.commit()
+    print(f'Импортировано строк: {rows}')
+
+
+async def run_export(path: str, file_format: str):
+    output = sys.stdout.buffer if path == '-' else open(path, 'wb')
+    try:
+        async for chunk in export_products(sessionmanager, file_format):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+async def main(args: argparse.Namespace):
+    # Разовые массовые операции не ограничиваются statement_timeout
+    database = dataclasses.replace(settings.database,
+                                   statement_timeout_ms=0)
+    sessionmanager.init(database.url, database.engine_kwargs())
+    try:
+        file_format = detect_format(args.path, args.format)
+        if args.command == 'import-products':
+            await run_import(args.path, file_format)
+        else:
+            await run_export(args.path, file_format)
+    finally:
+        await sessionmanager.close()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Массовая загрузка и выгрузка продуктов через COPY.')
+    parser.add_argument('command', choices=('import-products',
+                                            'export-products'))
+    parser.add_argument('path', help='Путь к файлу, "-" для stdout')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='По умолчанию определяется по расширению')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,241 @@
+import asyncio
+import collections
+import contextlib
+import math
+import time
+from typing import Deque, Dict
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+from starlette.routing import Match, Router
+
+from app.core.config import AdmissionSettings
+from app.core.metrics import CallbackGauge, Counter, Histogram, registry
+
+QUEUE_FULL = 'Сервер перегружен, повторите запрос позже.'
+RATE_LIMITED = 'Слишком много запросов, повторите позже.'
+# Сколько клиентов помнит ограничитель частоты.
+MAX_CLIENTS = 10000
+# Метка route общего ограничителя воркера в гейджах /metrics.
+TOTAL = '*'
+
+
+class ConcurrencyLimiter:
+    """
+    Не больше limit одновременных запросов, до queue_size ждут в
+    очереди FIFO. Освободившееся место передается первому ожидающему.
+    """
+
+    def __init__(self, limit: int, queue_size: int):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float) -> bool:
+        """
+        False - очередь полна или место не освободилось за timeout
+        секунд; запрос нужно отклонить.
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            async with asyncio.timeout(timeout):
+                await future
+        except TimeoutError:
+            self._abandon(future)
+            return False
+        except asyncio.CancelledError:
+            # Клиент отключился, пока ждал в очереди
+            self._abandon(future)
+            raise
+        return True
+
+    def _abandon(self, future: asyncio.Future):
+        if future.done() and not future.cancelled():
+            # Место передали одновременно с отменой ожидания
+            self.release()
+        else:
+            # release() мог уже снять отмененное ожидание с очереди
+            with contextlib.suppress(ValueError):
+                self._waiters.remove(future)
+
+    def release(self):
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов по клиентам: rate токенов в секунду,
+    не больше burst про запас.
+    """
+
+    def __init__(self, rate: float, burst: int,
+                 max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: collections.OrderedDict = collections.OrderedDict()
+
+    def take(self, client: str) -> float:
+        """
+        Забирает токен клиента. Возвращает 0, если запрос разрешен,
+        иначе сколько секунд ждать следующего токена.
+        """
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+# Ограничители по имени маршрута для гейджей /metrics.
+_limiters: Dict[str, ConcurrencyLimiter] = {}
+
+
+def _limiter_values(attribute: str):
+    def collect():
+        for route, limiter in list(_limiters.items()):
+            yield (route,), getattr(limiter, attribute)
+    return collect
+
+
+admission_rejected = registry.register(Counter(
+    'admission_rejected_total', 'Запросы, отклоненные до обработки.',
+    ('route', 'reason')))
+admission_wait = registry.register(Histogram(
+    'admission_wait_seconds', 'Ожидание в очереди перед обработкой.',
+    ('route',)))
+registry.register(CallbackGauge(
+    'admission_limit', 'Одновременных запросов на маршрут.', ('route',),
+    callback=_limiter_values('limit')))
+registry.register(CallbackGauge(
+    'admission_in_flight', 'Запросов маршрута в обработке.', ('route',),
+    callback=_limiter_values('active')))
+registry.register(CallbackGauge(
+    'admission_queued', 'Запросов маршрута в очереди.', ('route',),
+    callback=_limiter_values('queued')))
+
+
+class AdmissionMiddleware:
+    """
+    ASGI-middleware перед пулом БД. Запросы к маршрутам /api/ проходят
+    ограничение частоты по клиенту (429) и лимит одновременных запросов
+    маршрута с ограниченной очередью (503). Отказ приходит сразу
+    с Retry-After, а не после таймаута пула. Лимиты маршрутов - доли,
+    их сумма может превышать пул: общий ограничитель total_limit
+    держит все маршруты вместе в пределах соединений пула.
+    """
+
+    def __init__(self, app, router: Router, settings: AdmissionSettings):
+        self.app = app
+        self.router = router
+        self.settings = settings
+        self.bucket = (TokenBucket(settings.rate_limit, settings.rate_burst)
+                       if settings.rate_limit > 0 else None)
+        self.limiters: Dict[str, ConcurrencyLimiter] = {}
+        self.total = None
+        if settings.total_limit:
+            self.total = ConcurrencyLimiter(settings.total_limit,
+                                            settings.queue_size)
+            _limiters[TOTAL] = self.total
+
+    def _route(self, scope):
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route
+        return None
+
+    def _limiter(self, name: str) -> ConcurrencyLimiter:
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            limit = self.settings.route_limits.get(
+                name, self.settings.default_limit)
+            if self.total is not None:
+                limit = min(limit, self.total.limit)
+            limiter = ConcurrencyLimiter(limit, self.settings.queue_size)
+            self.limiters[name] = _limiters[name] = limiter
+        return limiter
+
+    async def __call__(self, scope, receive, send):
+        route = (self._route(scope) if scope['type'] == 'http'
+                 and scope['path'].startswith('/api/') else None)
+        if route is None or route.name in self.settings.exempt_routes:
+            await self.app(scope, receive, send)
+            return
+        # Для меток MetricsMiddleware, если до роутера запрос не дойдет
+        scope['route'] = route
+
+        if self.bucket is not None and scope.get('client'):
+            wait = self.bucket.take(scope['client'][0])
+            if wait:
+                admission_rejected.inc(route.name, 'rate_limited')
+                await self._reject(status.HTTP_429_TOO_MANY_REQUESTS,
+                                   RATE_LIMITED, math.ceil(wait),
+                                   scope, receive, send)
+                return
+
+        limiter = self._limiter(route.name)
+        start = time.perf_counter()
+        if not await self._acquire(limiter):
+            admission_rejected.inc(route.name, 'overloaded')
+            await self._reject(status.HTTP_503_SERVICE_UNAVAILABLE,
+                               QUEUE_FULL, self.settings.retry_after,
+                               scope, receive, send)
+            return
+        admission_wait.observe(time.perf_counter() - start, route.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if self.total is not None:
+                self.total.release()
+            limiter.release()
+
+    async def _acquire(self, limiter: ConcurrencyLimiter) -> bool:
+        """
+        Место маршрута, затем место в общем лимите; оба ожидания вместе
+        не дольше queue_timeout.
+        """
+        deadline = time.monotonic() + self.settings.queue_timeout
+        if not await limiter.acquire(self.settings.queue_timeout):
+            return False
+        if self.total is None:
+            return True
+        try:
+            acquired = await self.total.acquire(
+                max(deadline - time.monotonic(), 0))
+        except BaseException:
+            limiter.release()
+            raise
+        if not acquired:
+            limiter.release()
+        return acquired
+
+    @staticmethod
+    async def _reject(status_code: int, detail: str, retry_after: int,
+                      scope, receive, send):
+        response = JSONResponse({'detail': detail}, status_code,
+                                headers={'Retry-After': str(retry_after)})
+        await response(scope, receive, send)
@@ -0,0 +1,278 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def env_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    return os.getenv(name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return default if value in (None, '') else int(value)
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return default if value in (None, '') else float(value)
+
+
+def env_list(name: str) -> Tuple[str, ...]:
+    value = os.getenv(name) or ''
+    return tuple(item.strip() for item in value.split(',') if item.strip())
+
+
+def env_limits(name: str, default: Dict[str, int]) -> Dict[str, int]:
+    # Формат: create_order=16,get_products=8
+    items = env_list(name)
+    if not items:
+        return dict(default)
+    limits = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        limits[key.strip()] = int(value)
+    return limits
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in TRUE_VALUES
+
+
+@dataclass(frozen=True)
+class DatabaseSettings:
+    """
+    Настройки подключения к БД. Все значения читаются из переменных
+    окружения с префиксом DATABASE_ (DATABASE_POOL_SIZE и т.д.).
+    """
+    url: Optional[str] = None
+    # Реплики только для чтения, через запятую в DATABASE_REPLICA_URLS.
+    replica_urls: Tuple[str, ...] = ()
+    # Сколько секунд после записи клиент читает с primary.
+    read_sticky_seconds: float = 5.0
+    # Сколько секунд не обращаться к реплике после ошибки подключения.
+    replica_retry_seconds: float = 5.0
+    echo: bool = False
+    pool_size: int = 20
+    max_overflow: int = 10
+    pool_timeout: float = 10.0
+    pool_pre_ping: bool = False
+    pool_recycle: int = 1800
+    # Кэш подготовленных выражений asyncpg (на соединение).
+    statement_cache_size: int = 500
+    # Кэш подготовленных выражений диалекта SQLAlchemy (на соединение).
+    prepared_statement_cache_size: int = 500
+    # Серверный statement_timeout в миллисекундах, 0 - без ограничения.
+    statement_timeout_ms: int = 15000
+    # Сколько соединений открыть при старте; по умолчанию весь pool_size.
+    warmup_connections: Optional[int] = None
+
+    @classmethod
+    def from_env(cls, prefix: str = 'DATABASE_') -> 'DatabaseSettings':
+        defaults = cls()
+        pool_size = env_int(f'{prefix}POOL_SIZE', defaults.pool_size)
+        return cls(
+            url=env_str(f'{prefix}URL'),
+            replica_urls=env_list(f'{prefix}REPLICA_URLS'),
+            read_sticky_seconds=env_float(f'{prefix}READ_STICKY_SECONDS',
+                                          defaults.read_sticky_seconds),
+            replica_retry_seconds=env_float(
+                f'{prefix}REPLICA_RETRY_SECONDS',
+                defaults.replica_retry_seconds),
+            echo=env_bool(f'{prefix}ECHO', defaults.echo),
+            pool_size=pool_size,
+            max_overflow=env_int(f'{prefix}MAX_OVERFLOW',
+                                 defaults.max_overflow),
+            pool_timeout=env_float(f'{prefix}POOL_TIMEOUT',
+                                   defaults.pool_timeout),
+            pool_pre_ping=env_bool(f'{prefix}POOL_PRE_PING',
+                                   defaults.pool_pre_ping),
+            pool_recycle=env_int(f'{prefix}POOL_RECYCLE',
+                                 defaults.pool_recycle),
+            statement_cache_size=env_int(f'{prefix}STATEMENT_CACHE_SIZE',
+                                         defaults.statement_cache_size),
+            prepared_statement_cache_size=env_int(
+                f'{prefix}PREPARED_STATEMENT_CACHE_SIZE',
+                defaults.prepared_statement_cache_size),
+            statement_timeout_ms=env_int(f'{prefix}STATEMENT_TIMEOUT_MS',
+                                         defaults.statement_timeout_ms),
+            warmup_connections=env_int(f'{prefix}WARMUP_CONNECTIONS',
+                                       pool_size),
+        )
+
+    def engine_kwargs(self) -> Dict[str, Any]:
+        server_settings = {}
+        if self.statement_timeout_ms:
+            server_settings['statement_timeout'] = str(
+                self.statement_timeout_ms)
+        return {
+            'echo': self.echo,
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_timeout': self.pool_timeout,
+            'pool_pre_ping': self.pool_pre_ping,
+            'pool_recycle': self.pool_recycle,
+            'connect_args': {
+                'statement_cache_size': self.statement_cache_size,
+                'prepared_statement_cache_size':
+                    self.prepared_statement_cache_size,
+                'server_settings': server_settings,
+            },
+        }
+
+
+def cpu_count() -> int:
+    # Учитывает ограничение CPU контейнера через affinity
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+@dataclass(frozen=True)
+class ServerSettings:
+    """
+    Настройки боевого запуска (python -m app.server), переменные
+    окружения с префиксом SERVER_.
+    """
+    host: str = '0.0.0.0'
+    port: int = 8000
+    # По умолчанию по воркеру на доступное ядро.
+    workers: Optional[int] = None
+    # Сколько секунд после SIGTERM дожидаться незавершенных запросов.
+    graceful_timeout: float = 30.0
+    keepalive_timeout: int = 5
+    backlog: int = 2048
+
+    @classmethod
+    def from_env(cls, prefix: str = 'SERVER_') -> 'ServerSettings':
+        defaults = cls()
+        workers = env_int(f'{prefix}WORKERS', 0)
+        return cls(
+            host=env_str(f'{prefix}HOST', defaults.host),
+            port=env_int(f'{prefix}PORT', defaults.port),
+            workers=workers or cpu_count(),
+            graceful_timeout=env_float(f'{prefix}GRACEFUL_TIMEOUT',
+                                       defaults.graceful_timeout),
+            keepalive_timeout=env_int(f'{prefix}KEEPALIVE_TIMEOUT',
+                                      defaults.keepalive_timeout),
+            backlog=env_int(f'{prefix}BACKLOG', defaults.backlog),
+        )
+
+
+@dataclass(frozen=True)
+class AdmissionSettings:
+    """
+    Ограничение нагрузки перед пулом БД, переменные окружения
+    с префиксом ADMISSION_.
+    """
+    enabled: bool = True
+    # Одновременных запросов воркера на всех маршрутах вместе;
+    # по умолчанию pool_size + max_overflow пула БД.
+    total_limit: Optional[int] = None
+    # Одновременных запросов на маршрут (имя обработчика), остальные
+    # ждут в очереди. Создание заказа получает большую долю пула.
+    default_limit: int = 8
+    route_limits: Dict[str, int] = field(default_factory=lambda: {
+        'create_order': 16, 'create_orders_batch': 4})
+    queue_size: int = 32
+    # Сколько секунд запрос ждет в очереди, прежде чем получить 503.
+    queue_timeout: float = 2.0
+    retry_after: int = 1
+    # Долгие ответы без соединения с БД не ограничиваются.
+    exempt_routes: Tuple[str, ...] = ('stream_products',)
+    # Запросов в секунду с одного клиента, 0 - без ограничения.
+    rate_limit: float = 0.0
+    rate_burst: int = 20
+
+    @classmethod
+    def from_env(cls, prefix: str = 'ADMISSION_',
+                 pool_capacity: Optional[int] = None) -> 'AdmissionSettings':
+        defaults = cls()
+        return cls(
+            enabled=env_bool(f'{prefix}ENABLED', defaults.enabled),
+            total_limit=env_int(f'{prefix}TOTAL_LIMIT', pool_capacity),
+            default_limit=env_int(f'{prefix}DEFAULT_LIMIT',
+                                  defaults.default_limit),
+            route_limits=env_limits(f'{prefix}ROUTE_LIMITS',
+                                    defaults.route_limits),
+            queue_size=env_int(f'{prefix}QUEUE_SIZE', defaults.queue_size),
+            queue_timeout=env_float(f'{prefix}QUEUE_TIMEOUT',
+                                    defaults.queue_timeout),
+            retry_after=env_int(f'{prefix}RETRY_AFTER',
+                                defaults.retry_after),
+            exempt_routes=(env_list(f'{prefix}EXEMPT_ROUTES')
+                           or defaults.exempt_routes),
+            rate_limit=env_float(f'{prefix}RATE_LIMIT', defaults.rate_limit),
+            rate_burst=env_int(f'{prefix}RATE_BURST', defaults.rate_burst),
+        )
+
+
+@dataclass(frozen=True)
+class Settings:
+    database: DatabaseSettings = field(default_factory=DatabaseSettings)
+    server: ServerSettings = field(default_factory=ServerSettings)
+    admission: AdmissionSettings = field(default_factory=AdmissionSettings)
+    product_cache_size: int = 10000
+    product_cache_ttl: float = 30.0
+    # Кэш страниц поиска: остатки в нем могут отставать на search_cache_ttl.
+    search_cache_size: int = 1000
+    search_cache_ttl: float = 5.0
+    # Сколько миллисекунд копить изменения продуктов перед рассылкой
+    # подписчикам /products/stream.
+    stock_stream_window_ms: float = 50.0
+    # Групповая фиксация заказов: POST /orders/ копит заказы в очереди
+    # и сохраняет их пачками в одной транзакции.
+    order_batching: bool = False
+    order_batch_size: int = 100
+    # Сколько миллисекунд ждать остальные заказы пачки после первого.
+    order_batch_window_ms: float = 2.0
+    # Сколько секунд хранится ответ по заголовку Idempotency-Key.
+    idempotency_ttl: float = 86400.0
+    # Как часто удалять устаревшие ключи из БД, в секундах.
+    idempotency_cleanup_interval: float = 3600.0
+    idempotency_cache_size: int = 10000
+
+    @classmethod
+    def from_env(cls) -> 'Settings':
+        defaults = cls()
+        database = DatabaseSettings.from_env()
+        return cls(
+            database=database,
+            server=ServerSettings.from_env(),
+            admission=AdmissionSettings.from_env(
+                pool_capacity=database.pool_size + database.max_overflow),
+            product_cache_size=env_int('PRODUCT_CACHE_SIZE',
+                                       defaults.product_cache_size),
+            product_cache_ttl=env_float('PRODUCT_CACHE_TTL',
+                                        defaults.product_cache_ttl),
+            search_cache_size=env_int('SEARCH_CACHE_SIZE',
+                                      defaults.search_cache_size),
+            search_cache_ttl=env_float('SEARCH_CACHE_TTL',
+                                       defaults.search_cache_ttl),
+            stock_stream_window_ms=env_float(
+                'STOCK_STREAM_WINDOW_MS', defaults.stock_stream_window_ms),
+            order_batching=env_bool('ORDER_BATCHING',
+                                    defaults.order_batching),
+            order_batch_size=env_int('ORDER_BATCH_SIZE',
+                                     defaults.order_batch_size),
+            order_batch_window_ms=env_float('ORDER_BATCH_WINDOW_MS',
+                                            defaults.order_batch_window_ms),
+            idempotency_ttl=env_float('IDEMPOTENCY_TTL',
+                                      defaults.idempotency_ttl),
+            idempotency_cleanup_interval=env_float(
+                'IDEMPOTENCY_CLEANUP_INTERVAL',
+                defaults.idempotency_cleanup_interval),
+            idempotency_cache_size=env_int('IDEMPOTENCY_CACHE_SIZE',
+                                           defaults.idempotency_cache_size),
+        )
+
+
+settings = Settings.from_env()
@@ -0,0 +1,297 @@
+import abc
+import contextvars
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.models.cache import product_cache
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 50, 100)
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def _escape(value) -> str:
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"'
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Metric(abc.ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}',
+                f'# TYPE {self.name} {self.kind}']
+
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        """Строки значений метрики в текстовом формате Prometheus."""
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} '
+                f'{value}' for labels, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # labels -> [счетчики по корзинам (+Inf последней), сумма, количество]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1),
+                                            0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def count(self, *labels) -> int:
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        lines = []
+        names = self.labelnames + ('le',)
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket'
+                             f'{_format_labels(names, labels + (bound,))} '
+                             f'{cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {total}')
+            lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+
+class CallbackGauge(Metric):
+    """
+    Значение вычисляется в момент запроса /metrics: callback возвращает
+    пары (значения меток, число).
+    """
+    kind = 'gauge'
+
+    def __init__(self, *args,
+                 callback: Callable[[], Iterable[Tuple[Tuple, float]]],
+                 kind: str = 'gauge', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} '
+                f'{value}' for labels, value in self.callback()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    'http_requests_total', 'Число HTTP-запросов.',
+    ('method', 'route', 'status')))
+http_latency = registry.register(Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса.',
+    ('method', 'route')))
+http_db_statements = registry.register(Histogram(
+    'http_request_db_statements', 'SQL-запросов на один HTTP-запрос.',
+    ('method', 'route'), buckets=STATEMENT_BUCKETS))
+http_db_time = registry.register(Histogram(
+    'http_request_db_seconds', 'Время SQL-запросов на один HTTP-запрос.',
+    ('method', 'route')))
+db_statements = registry.register(Counter(
+    'db_statements_total', 'Число выполненных SQL-запросов.', ('engine',)))
+db_statement_time = registry.register(Histogram(
+    'db_statement_duration_seconds', 'Время выполнения SQL-запроса.',
+    ('engine',)))
+pool_checkout_time = registry.register(Histogram(
+    'db_pool_checkout_seconds',
+    'Ожидание соединения из пула (включая открытие нового).', ('engine',)))
+orders_created = registry.register(Counter(
+    'orders_created_total', 'Итоги создания заказов.', ('outcome',)))
+order_batch_size = registry.register(Histogram(
+    'order_batch_size', 'Заказов в одной транзакции групповой фиксации.',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)))
+
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def _pool_values(attribute: str):
+    def collect():
+        for name, engine in list(_engines.items()):
+            pool = engine.sync_engine.pool
+            if hasattr(pool, attribute):
+                yield (name,), getattr(pool, attribute)()
+    return collect
+
+
+registry.register(CallbackGauge(
+    'db_pool_size', 'Размер пула соединений.', ('engine',),
+    callback=_pool_values('size')))
+registry.register(CallbackGauge(
+    'db_pool_checked_out', 'Соединений выдано из пула.', ('engine',),
+    callback=_pool_values('checkedout')))
+registry.register(CallbackGauge(
+    'db_pool_overflow', 'Соединений сверх pool_size.', ('engine',),
+    callback=_pool_values('overflow')))
+
+registry.register(CallbackGauge(
+    'product_cache_events_total', 'События кэша продуктов.', ('event',),
+    kind='counter',
+    callback=lambda: [((name,), value)
+                      for name, value in product_cache.stats().items()
+                      if name != 'size']))
+registry.register(CallbackGauge(
+    'product_cache_size', 'Записей в кэше продуктов.',
+    callback=lambda: [((), len(product_cache))]))
+
+
+class RequestStats:
+    __slots__ = ('statements', 'db_time')
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = (
+    contextvars.ContextVar('current_request', default=None))
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, который замеряет время получения соединения. Имя движка
+    для метки задается в instrument_engine.
+    """
+    metrics_name = 'default'
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_time.observe(time.perf_counter() - start,
+                                       self.metrics_name)
+
+
+def instrument_engine(engine: AsyncEngine, name: str):
+    """
+    Подписывается на события движка: число и время SQL-запросов
+    в целом и в рамках текущего HTTP-запроса, гейджи пула.
+    """
+    sync_engine = engine.sync_engine
+    _engines[name] = engine
+    if isinstance(sync_engine.pool, InstrumentedQueuePool):
+        sync_engine.pool.metrics_name = name
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context,
+                             executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        db_statements.inc(name)
+        db_statement_time.observe(elapsed, name)
+        stats = current_request.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+
+
+def forget_engines():
+    _engines.clear()
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware без обертки BaseHTTPMiddleware: считает запросы,
+    задержку и SQL на шаблон маршрута (scope['route'] ставит роутер).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            route = scope.get('route')
+            path = route.path if route is not None else UNMATCHED_ROUTE
+            method = scope['method']
+            http_requests.inc(method, path, status_code)
+            http_latency.observe(time.perf_counter() - start, method, path)
+            http_db_statements.observe(stats.statements, method, path)
+            http_db_time.observe(stats.db_time, method, path)
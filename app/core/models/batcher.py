@@ -0,0 +1,131 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from app.core.metrics import order_batch_size
+from app.core.models.crud import save_orders_batch
+from app.core.models.database import DatabaseSessionManager
+from app.core.models.models import Order, OrderItem, Product
+
+_STOP = object()
+
+
+class OrderBatcher:
+    """
+    Групповая фиксация заказов. Заказы из обработчиков попадают в очередь,
+    фоновая задача забирает их пачками (не больше max_batch и не дольше
+    window секунд после первого заказа пачки) и сохраняет каждую пачку
+    одной транзакцией через save_orders_batch. Каждый вызывающий ждет
+    свой результат; отклоненный заказ не мешает остальным в пачке.
+    """
+
+    def __init__(self, max_batch: int = 100, window: float = 0.002):
+        self.max_batch = max_batch
+        self.window = window
+        self._manager: Optional[DatabaseSessionManager] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        """
+        Принимает ли батчер заказы: после начала stop() уже нет.
+        """
+        return (self._task is not None and not self._task.done()
+                and not self._stopping)
+
+    def start(self, manager: DatabaseSessionManager,
+              max_batch: Optional[int] = None,
+              window: Optional[float] = None):
+        if max_batch is not None:
+            self.max_batch = max_batch
+        if window is not None:
+            self.window = window
+        self._manager = manager
+        self._stopping = False
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Сохраняет уже принятые заказы и останавливает фоновую задачу.
+        Флаг ставится до _STOP в очереди: заказ, пришедший позже,
+        не встанет за _STOP, где его никто не заберет.
+        """
+        self._stopping = True
+        if self._task is not None and not self._task.done():
+            await self._queue.put(_STOP)
+            await self._task
+        self._task = None
+
+    async def submit(self, order: Dict) -> Dict:
+        """
+        Ставит заказ в очередь и ждет результат его пачки: словарь со
+        status_code и order или detail, как у save_orders_batch.
+        Если батчер уже останавливается, заказ сохраняется отдельной
+        транзакцией.
+        """
+        if not self.running:
+            return (await self._save([order]))[0]
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((order, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout > 0:
+                        item = await asyncio.wait_for(self._queue.get(),
+                                                      timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            order_batch_size.observe(len(batch))
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        try:
+            results = await self._save([order for order, _ in batch])
+        except Exception as error:
+            if len(batch) == 1:
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(error)
+                return
+            # Ошибка БД уронила всю пачку: сохраняем заказы по одному,
+            # чтобы она досталась только виновному.
+            for item in batch:
+                await self._flush([item])
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _save(self, orders: List[Dict]) -> List[Dict]:
+        async with self._manager.session() as session:
+            results = await save_orders_batch(
+                db=session, model=Product, save_model=OrderItem,
+                order_model=Order, orders=orders)
+            await session.commit()
+        return results
+
+
+order_batcher = OrderBatcher()
+
+
+def get_order_batcher() -> Optional[OrderBatcher]:
+    return order_batcher if order_batcher.running else None
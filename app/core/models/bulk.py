@@ -0,0 +1,258 @@
+import asyncio
+import contextlib
+import csv
+import json
+import re
+from decimal import Decimal
+from typing import AsyncIterable, AsyncIterator, Tuple
+
+import asyncpg
+from fastapi import HTTPException, status
+from sqlalchemy import (Column, Identity, Integer, MetaData, Numeric,
+                        Table, Text, and_, func, select, text, true,
+                        update)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateTable
+
+from app.core.models.cache import (product_cache, search_cache,
+                                   invalidate_after_commit)
+from app.core.models.database import DatabaseSessionManager
+from app.core.models.models import (Product, ProductStockShard,
+                                    product_version_seq)
+from app.v1.api.constants import IMPORT_ERROR, IMPORT_ROW_ERROR
+
+FORMATS = ('csv', 'ndjson')
+PRODUCT_FIELDS = ('name', 'description', 'price', 'amount_left')
+REQUIRED_FIELDS = ('name', 'price', 'amount_left')
+EXPORT_COLUMNS = ('id',) + PRODUCT_FIELDS
+# Сколько чанков выгрузки ждут медленного клиента.
+EXPORT_QUEUE_SIZE = 16
+
+# Временная таблица, в которую COPY льет данные перед upsert в products.
+# Живет только до конца транзакции импорта. line - номер записи в файле
+# (без заголовка CSV и пустых строк), COPY заполняет его по порядку.
+# name и price без ограничений длины и точности: их проверяет VALID_ROW.
+staging = Table(
+    'products_import', MetaData(),
+    Column('line', Integer, Identity()),
+    Column('id', Integer),
+    Column('name', Text),
+    Column('description', Text),
+    Column('price', Numeric),
+    Column('amount_left', Integer),
+    prefixes=['TEMPORARY'],
+    postgresql_on_commit='DROP',
+)
+# Те же ограничения, что у ProductCreateUpdate, и точность products.price.
+VALID_ROW = and_(
+    func.char_length(staging.c.name).between(3, 255),
+    staging.c.price > 0,
+    staging.c.price < 10 ** 8,
+    func.scale(staging.c.price) <= 2,
+    staging.c.amount_left > 0,
+)
+# Номер записи в контексте ошибки COPY: "COPY products_import, line 3".
+COPY_LINE = re.compile(r'\bline (\d+)')
+# COPY большого каталога и потоковая выгрузка идут дольше серверного
+# statement_timeout пула; снимаем его только до конца транзакции.
+NO_STATEMENT_TIMEOUT = text('SET LOCAL statement_timeout = 0')
+
+
+async def _driver_connection(db: AsyncSession) -> asyncpg.Connection:
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    return raw.driver_connection
+
+
+async def _split_header(
+        chunks: AsyncIterable[bytes]) -> Tuple[list, AsyncIterator[bytes]]:
+    """
+    Читает первую строку CSV, чтобы передать COPY список колонок,
+    и возвращает итератор по оставшимся байтам.
+    """
+    iterator = aiter(chunks)
+    buffer = b''
+    while b'\n' not in buffer:
+        try:
+            buffer += await anext(iterator)
+        except StopAsyncIteration:
+            break
+    header, _, rest = buffer.partition(b'\n')
+    columns = next(csv.reader([header.decode('utf-8-sig')]), [])
+    columns = [name.strip() for name in columns]
+
+    async def body():
+        if rest:
+            yield rest
+        async for chunk in iterator:
+            yield chunk
+
+    return columns, body()
+
+
+async def _ndjson_records(chunks: AsyncIterable[bytes]):
+    """
+    Разбирает NDJSON построчно, не держа в памяти больше одного чанка.
+    """
+    buffer = b''
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            if line.strip():
+                number += 1
+                yield _ndjson_record(line, number)
+    if buffer.strip():
+        yield _ndjson_record(buffer, number + 1)
+
+
+def _ndjson_record(line: bytes, number: int) -> tuple:
+    try:
+        item = json.loads(line, parse_float=Decimal)
+        return (str(item['name']), item.get('description'),
+                Decimal(item['price']), int(item['amount_left']))
+    except (ValueError, KeyError, TypeError, ArithmeticError):
+        raise _row_error(number)
+
+
+def _row_error(number: int) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                         detail=IMPORT_ROW_ERROR.format(number))
+
+
+def _import_error(error: Exception) -> HTTPException:
+    """
+    Ошибку драйвера не отдаем клиенту как есть: сообщаем только номер
+    записи, если COPY его назвал.
+    """
+    match = COPY_LINE.search(getattr(error, 'context', None) or '')
+    if match:
+        return _row_error(int(match.group(1)))
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                         detail=IMPORT_ERROR.format('некорректный файл'))
+
+
+async def import_products(
+        db: AsyncSession,
+        chunks: AsyncIterable[bytes],
+        file_format: str = 'csv') -> int:
+    """
+    Потоковый импорт продуктов через протокол COPY.
+    Данные идут во временную таблицу, затем одним
+    INSERT ... ON CONFLICT (name) DO UPDATE переносятся в products.
+    Записи проверяются по тем же правилам, что и ProductCreateUpdate;
+    первая некорректная отклоняет весь файл с ее номером. Из записей
+    с одинаковым именем побеждает последняя. Память не зависит
+    от размера файла. Возвращает число вставленных или обновленных
+    строк. Фиксация за вызывающим кодом.
+    """
+    await db.execute(NO_STATEMENT_TIMEOUT)
+    await db.execute(CreateTable(staging))
+    driver = await _driver_connection(db)
+    try:
+        if file_format == 'csv':
+            columns, body = await _split_header(chunks)
+            unknown = set(columns) - set(EXPORT_COLUMNS)
+            missing = set(REQUIRED_FIELDS) - set(columns)
+            if unknown or missing:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=IMPORT_ERROR.format(
+                        f'ожидались колонки {", ".join(EXPORT_COLUMNS)}'))
+            await driver.copy_to_table(staging.name, source=body,
+                                       columns=columns, format='csv')
+        else:
+            await driver.copy_records_to_table(
+                staging.name, records=_ndjson_records(chunks),
+                columns=PRODUCT_FIELDS)
+
+        invalid = await db.scalar(
+            select(staging.c.line)
+            .where(VALID_ROW.is_not(true()))
+            .order_by(staging.c.line)
+            .limit(1))
+        if invalid is not None:
+            raise _row_error(invalid)
+
+        # DISTINCT ON: одно имя дважды в файле иначе сломает ON CONFLICT.
+        staged = (select(*(staging.c[name] for name in PRODUCT_FIELDS))
+                  .distinct(staging.c.name)
+                  .order_by(staging.c.name, staging.c.line.desc()))
+        statement = insert(Product).from_select(PRODUCT_FIELDS, staged)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Product.name],
+            set_={**{name: statement.excluded[name]
+                     for name in PRODUCT_FIELDS[1:]},
+                  'version': product_version_seq.next_value()})
+        result = await db.execute(statement)
+        # Остаток из файла задается целиком: шарды обновленных продуктов
+        # обнуляются, как при PUT.
+        await db.execute(
+            update(ProductStockShard)
+            .where(ProductStockShard.product_id == Product.id,
+                   Product.name.in_(select(staging.c.name)))
+            .values(amount=0))
+    except (asyncpg.PostgresError, DBAPIError, ValueError) as error:
+        raise _import_error(error)
+    invalidate_after_commit(db, product_cache)
+    invalidate_after_commit(db, search_cache)
+    return result.rowcount
+
+
+async def export_products(
+        sessionmanager: DatabaseSessionManager,
+        file_format: str = 'csv') -> AsyncIterator[bytes]:
+    """
+    Потоковая выгрузка products через COPY TO STDOUT.
+    Чанки от COPY передаются через ограниченную очередь, поэтому
+    медленный клиент притормаживает выгрузку, а не копит ее в памяти.
+    Соединение берется из sessionmanager напрямую: зависимость get_db
+    закрывается раньше, чем отдается тело ответа.
+    """
+    # amount_left выгружается полным остатком, вместе с шардами.
+    columns = ', '.join(EXPORT_COLUMNS[:-1] + (
+        'amount_left + coalesce((SELECT sum(s.amount) FROM '
+        f'{ProductStockShard.__tablename__} AS s '
+        'WHERE s.product_id = products.id), 0) AS amount_left',))
+    if file_format == 'csv':
+        query = f'SELECT {columns} FROM products ORDER BY id'
+        options = {'format': 'csv', 'header': True}
+    else:
+        query = (f'SELECT row_to_json(p)::text FROM '
+                 f'(SELECT {columns} FROM products ORDER BY id) AS p')
+        # Одна колонка JSON: кавычки и разделитель, которых нет в JSON,
+        # чтобы csv-формат COPY выдал строки без экранирования.
+        options = {'format': 'csv', 'quote': '\x01', 'delimiter': '\x02'}
+
+    queue = asyncio.Queue(maxsize=EXPORT_QUEUE_SIZE)
+    done = object()
+
+    async def put(chunk):
+        await queue.put(bytes(chunk))
+
+    async def produce():
+        # Не в finally: после отмены (клиент отключился) очередь никто
+        # не читает, и put на полной очереди ждал бы вечно.
+        try:
+            async with sessionmanager.connect() as connection:
+                await connection.execute(NO_STATEMENT_TIMEOUT)
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.copy_from_query(
+                    query, output=put, **options)
+        except Exception as error:
+            await queue.put(error)
+        await queue.put(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (chunk := await queue.get()) is not done:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await producer
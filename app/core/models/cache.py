@@ -0,0 +1,192 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+PENDING_INVALIDATIONS = 'cache_invalidations'
+# Сбросы кэша с каналом рассылаются через NOTIFY при фиксации;
+# '*' - сброс всего кэша. Полезная нагрузка NOTIFY короче 8000 байт.
+CLEAR_ALL = '*'
+NOTIFY_PAYLOAD_LIMIT = 7900
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш в памяти процесса с ограничением по числу записей и по времени
+    жизни каждой записи. Ведет счетчики попаданий, промахов, вытеснений
+    и истечений. Рассчитан на один event loop, блокировок не требует.
+
+    Заполнение с проверкой версии: читатель запоминает version() до
+    запроса к БД и передает ее в set(); если ключ за это время сбросили,
+    прочитанное значение могло устареть и в кэш не попадает. Значение,
+    прочитанное с реплики, может отставать на lag секунд: оно не
+    попадает в кэш, если ключ сбрасывали за последние lag секунд.
+    """
+
+    def __init__(self, maxsize: int, ttl: float,
+                 clock: Callable[[], float] = time.monotonic,
+                 channel: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Канал NOTIFY, в который invalidate_after_commit сообщает
+        # другим воркерам о сброшенных ключах.
+        self.channel = channel
+        self._clock = clock
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Номер и время последнего сброса: общие для кэша и по ключам.
+        # Сбросы старых ключей забываются, последний из забытых остается
+        # в _forgotten.
+        self._version = 0
+        self._invalidated: OrderedDict = OrderedDict()
+        self._forgotten = (0, float('-inf'))
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def version(self) -> int:
+        return self._version
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None,
+            lag: float = 0.0):
+        if self.maxsize <= 0:
+            return
+        invalidated, invalidated_at = self._invalidated.get(
+            key, self._forgotten)
+        if version is not None and invalidated > version:
+            return
+        if lag and invalidated_at > self._clock() - lag:
+            return
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+        self._version += 1
+        self._invalidated[key] = (self._version, self._clock())
+        self._invalidated.move_to_end(key)
+        while len(self._invalidated) > max(self.maxsize, 1):
+            _, self._forgotten = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self._version += 1
+        self._invalidated.clear()
+        self._forgotten = (self._version, self._clock())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+PRODUCT_CHANNEL = 'product_changes'
+product_cache = TTLCache(maxsize=settings.product_cache_size,
+                         ttl=settings.product_cache_ttl,
+                         channel=PRODUCT_CHANNEL)
+# (q, limit, cursor) -> страница поиска продуктов.
+search_cache = TTLCache(maxsize=settings.search_cache_size,
+                        ttl=settings.search_cache_ttl)
+
+
+def invalidate_after_commit(
+        db: AsyncSession,
+        cache: TTLCache,
+        keys: Optional[Iterable[Hashable]] = None):
+    """
+    Сбрасывает записи сразу и еще раз после фиксации транзакции:
+    иначе параллельное чтение между UPDATE и COMMIT успеет положить
+    в кэш старые данные. keys=None очищает кэш целиком. Для кэша
+    с каналом ключи уходят в NOTIFY в той же транзакции.
+    """
+    keys = None if keys is None else list(keys)
+    _invalidate(cache, keys)
+    db.sync_session.info.setdefault(
+        PENDING_INVALIDATIONS, []).append((cache, keys))
+
+
+def _invalidate(cache: TTLCache, keys: Optional[list]):
+    if keys is None:
+        cache.clear()
+        return
+    for key in keys:
+        cache.invalidate(key)
+
+
+def notify_payloads(keys: Optional[list]) -> list:
+    """Ключи через запятую, порциями не длиннее NOTIFY_PAYLOAD_LIMIT."""
+    if keys is None:
+        return [CLEAR_ALL]
+    payloads, current = [], ''
+    for key in dict.fromkeys(str(key) for key in keys):
+        if current and len(current) + len(key) >= NOTIFY_PAYLOAD_LIMIT:
+            payloads.append(current)
+            current = ''
+        current = f'{current},{key}' if current else key
+    if current:
+        payloads.append(current)
+    return payloads
+
+
+@event.listens_for(Session, 'before_commit')
+def _broadcast_invalidations(session: Session):
+    keys_by_channel = {}
+    for cache, keys in session.info.get(PENDING_INVALIDATIONS, ()):
+        if cache.channel is None:
+            continue
+        pending = keys_by_channel.setdefault(cache.channel, [])
+        if keys is None or pending is None:
+            keys_by_channel[cache.channel] = None
+        else:
+            pending.extend(keys)
+    for channel, keys in keys_by_channel.items():
+        payloads = notify_payloads(keys)
+        if payloads:
+            # NOTIFY доставляется только после COMMIT и пропадает при
+            # откате, поэтому слушатели не увидят незафиксированных данных.
+            session.execute(text(
+                'SELECT pg_notify(:channel, payload) '
+                'FROM unnest(CAST(:payloads AS text[])) AS payload'
+            ), {'channel': channel, 'payloads': payloads})
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidations(session: Session):
+    for cache, keys in session.info.pop(PENDING_INVALIDATIONS, ()):
+        _invalidate(cache, keys)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_invalidations(session: Session):
+    session.info.pop(PENDING_INVALIDATIONS, None)
@@ -0,0 +1,223 @@
+import asyncio
+import contextlib
+import json
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+from sqlalchemy import Integer, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import DBAPIError
+
+from app.core.models.cache import (CLEAR_ALL, PRODUCT_CHANNEL, product_cache,
+                                   search_cache)
+from app.core.models.database import DatabaseSessionManager
+from app.core.models.models import Product
+
+# Пауза перед повторным LISTEN после потери соединения, в секундах.
+RECONNECT_DELAY = 1.0
+CONNECTION_ERRORS = (DBAPIError, OSError, asyncpg.PostgresError,
+                     asyncpg.InterfaceError)
+
+
+class Subscription:
+    """
+    Подписка одного клиента. Изменения копятся словарем по id продукта,
+    поэтому медленный клиент получает последнее состояние товара,
+    а не всю очередь промежуточных.
+    """
+
+    def __init__(self, product_ids: Optional[Iterable[int]] = None):
+        self.product_ids = (None if product_ids is None
+                            else frozenset(product_ids))
+        self._changes: Dict[int, Dict] = {}
+        self._reset = False
+        self._ready = asyncio.Event()
+
+    def push(self, changes: Dict[int, Dict], reset: bool = False):
+        for product_id, change in changes.items():
+            if self.product_ids is None or product_id in self.product_ids:
+                self._changes[product_id] = change
+        self._reset = self._reset or reset
+        if self._changes or self._reset:
+            self._ready.set()
+
+    async def get(self, timeout: float) -> Tuple[bool, List[Dict]]:
+        """
+        Ждет изменений не дольше timeout секунд. Возвращает флаг
+        "перечитайте все" (пропущены уведомления или массовый импорт)
+        и накопленные изменения.
+        """
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        reset, changes = self._reset, list(self._changes.values())
+        self._reset = False
+        self._changes = {}
+        self._ready.clear()
+        return reset, changes
+
+
+class ProductChanges:
+    """
+    Поток изменений продуктов воркера. Отдельное соединение вне пула
+    слушает канал PRODUCT_CHANNEL, в который при фиксации пишет
+    invalidate_after_commit для product_cache. По уведомлению сбрасывается
+    кэш продуктов этого воркера (межпроцессная инвалидация), а изменения
+    за window секунд сворачиваются: остатки и цены всех затронутых
+    продуктов читаются одним запросом и раздаются подписчикам.
+    """
+
+    def __init__(self, window: float = 0.05):
+        self.window = window
+        self._manager: Optional[DatabaseSessionManager] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._subscribers: set = set()
+        self._pending: set = set()
+        self._reset = False
+        self._listening = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, manager: DatabaseSessionManager,
+              window: Optional[float] = None):
+        if window is not None:
+            self.window = window
+        self._manager = manager
+        self._listening = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._flush_task):
+            if task is not None:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        self._task = self._flush_task = None
+
+    async def wait_listening(self):
+        await self._listening.wait()
+
+    def subscribe(
+            self,
+            product_ids: Optional[Iterable[int]] = None) -> Subscription:
+        subscription = Subscription(product_ids)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    async def _run(self):
+        reconnected = False
+        while True:
+            try:
+                async with self._manager.driver_connection() as connection:
+                    closed = asyncio.Event()
+                    connection.add_termination_listener(
+                        lambda _: closed.set())
+                    await connection.add_listener(PRODUCT_CHANNEL,
+                                                  self._on_notify)
+                    if reconnected:
+                        # Пока соединения не было, уведомления терялись
+                        self._notify(None)
+                    self._listening.set()
+                    try:
+                        await closed.wait()
+                    finally:
+                        self._listening.clear()
+                        if not connection.is_closed():
+                            await connection.remove_listener(
+                                PRODUCT_CHANNEL, self._on_notify)
+            except CONNECTION_ERRORS:
+                pass
+            reconnected = True
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        self._notify(None if payload == CLEAR_ALL
+                     else [int(key) for key in payload.split(',')])
+
+    def _notify(self, product_ids: Optional[List[int]]):
+        if product_ids is None:
+            product_cache.clear()
+            search_cache.clear()
+            self._reset = True
+        else:
+            for product_id in product_ids:
+                product_cache.invalidate(product_id)
+            self._pending.update(product_ids)
+        if not self._subscribers:
+            self._pending.clear()
+            self._reset = False
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(self.window)
+        product_ids, reset = sorted(self._pending), self._reset
+        self._pending = set()
+        self._reset = False
+        changes = {}
+        if product_ids:
+            try:
+                rows = await self._read(product_ids)
+            except CONNECTION_ERRORS:
+                # Состояние не прочитано: пусть клиенты перечитают сами
+                product_ids, reset = [], True
+            for product_id in product_ids:
+                row = rows.get(product_id)
+                changes[product_id] = (
+                    {'id': product_id, 'deleted': True} if row is None
+                    else {'id': product_id,
+                          'amount_left': row.amount_available,
+                          'price': float(row.price)})
+        for subscription in list(self._subscribers):
+            subscription.push(changes, reset)
+        if self._pending or self._reset:
+            # Уведомления, пришедшие во время чтения
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _read(self, product_ids: List[int]) -> Dict:
+        async with self._manager.session() as session:
+            result = await session.execute(
+                select(Product.id, Product.amount_available, Product.price)
+                .where(Product.id == any_(bindparam(
+                    'ids', product_ids, type_=ARRAY(Integer)))))
+            return {row.id: row for row in result}
+
+
+def sse_event(event: str, data) -> bytes:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+async def product_events(
+        changes: ProductChanges,
+        product_ids: Optional[Iterable[int]] = None,
+        keepalive: float = 15.0) -> AsyncIterator[bytes]:
+    """
+    Тело ответа text/event-stream: событие stock на каждое изменение,
+    reset - когда клиенту нужно перечитать каталог, комментарий-пинг
+    раз в keepalive секунд, чтобы прокси не закрывали соединение.
+    """
+    subscription = changes.subscribe(product_ids)
+    try:
+        yield b': connected\n\n'
+        while True:
+            reset, items = await subscription.get(keepalive)
+            if reset:
+                yield sse_event('reset', {})
+            for item in items:
+                yield sse_event('stock', item)
+            if not reset and not items:
+                yield b': ping\n\n'
+    finally:
+        changes.unsubscribe(subscription)
+
+
+product_changes = ProductChanges()
+
+
+def get_product_changes() -> Optional[ProductChanges]:
+    return product_changes if product_changes.running else None
@@ -1,16 +1,28 @@
-from typing import Type, TypeVar, Dict, Optional
+import datetime
+import zlib
+from typing import (Type, TypeVar, Dict, Optional, Any, List,
+                    NamedTuple, Sequence, Tuple)
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
-from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import (select, Select, update, insert, delete, func,
+                        bindparam, column, any_, true, Integer, inspect,
+                        cast, case, or_, and_, Double, union)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 
-from app.core.models.models import Base
-from app.v1.api.constants import PRODUCT_EXISTS
+from app.core.models.cache import (TTLCache, product_cache,
+                                   invalidate_after_commit)
+from app.core.models.database import replica_lag
+from app.core.models.models import (Base, Order, OrderItem, ProductStockShard,
+                                    SEARCH_CONFIG)
+from app.v1.api.constants import (MAX_SEARCH_CANDIDATES,
+                                  MIN_SUBSTRING_SEARCH, PRODUCT_EXISTS,
+                                  STOCK_BUSY, STOCK_BUSY_RETRY_AFTER)
 
 
 ModelType = TypeVar('ModelType', bound=Base)
-ItemType = TypeVar('ItemType', bound=BaseModel)
+UNIQUE_VIOLATION = '23505'
 
 
 async def get_or_404(
@@ -18,16 +30,33 @@ async def get_or_404(
         model: Type[ModelType],
         identifier: Optional[int] = None,
         join_load: Optional[bool] = None,
+        cache: Optional[TTLCache] = None,
+        fresh: bool = False,
 ) -> ModelType:
     """
     Функция, которая возвращает объект по ИД. Если select_load=True,
     то выполняется запрос для выборки полей product_id и amount_of_product.
+    Если передан cache, объект читается через него и возвращается
+    словарем с полями модели (read-through кэш только для чтения);
+    прочитанное с реплики не кладется в кэш, если продукт менялся
+    в пределах ее отставания. fresh=True - прочитать из БД мимо кэша
+    (клиент читает после своей записи).
     """
-    exception = HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f'{model.__name__} с ИД {identifier} не найден.'
-            )
-    if not join_load and identifier:
+    exception = not_found(model, identifier)
+    if cache is not None and not join_load and identifier:
+        obj = None if fresh else cache.get(identifier)
+        if obj is None:
+            version = cache.version()
+            obj = await db.get(model, identifier)
+            if not obj:
+                raise exception
+            obj = snapshot(obj)
+            # Сброс во время чтения - значение могло устареть
+            cache.set(identifier, obj, version=version,
+                      lag=replica_lag(db))
+        return obj
+
+    elif not join_load and identifier:
         obj = await db.get(model, identifier)
         if not obj:
             raise exception
@@ -42,31 +71,296 @@ async def get_or_404(
 
         if not order:
             raise exception
-        products = {item.product_id: item.amount_of_product
-                    for item in order.order_items}
-        return {
-            'id': order.id,
-            'created_at': order.created_at,
-            'status': order.status,
-            'products': products
-        }
+        return order_snapshot(order)
+
+
+def order_snapshot(order) -> Dict[str, Any]:
+    """
+    Заказ в виде OrderGet: позиции сворачиваются в словарь
+    {product_id: amount_of_product}. order_items должны быть загружены.
+    """
+    return {
+        'id': order.id,
+        'created_at': order.created_at,
+        'status': order.status,
+        'products': {item.product_id: item.amount_of_product
+                     for item in order.order_items}
+    }
+
+
+def product_exists(error: IntegrityError) -> HTTPException:
+    """
+    Нарушение unique_name превращается в 400 PRODUCT_EXISTS, остальные
+    ошибки целостности пробрасываются как есть. Отдельный SELECT перед
+    записью не нужен: уникальность проверяет ограничение в БД.
+    """
+    if getattr(error.orig, 'sqlstate', None) != UNIQUE_VIOLATION:
+        raise error
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                         detail=PRODUCT_EXISTS)
+
+
+def snapshot(obj: ModelType) -> Dict[str, Any]:
+    """
+    Значения колонок объекта: их можно хранить в кэше и отдавать
+    из разных сессий, в отличие от самого ORM-объекта.
+    """
+    return {attr.key: getattr(obj, attr.key)
+            for attr in inspect(type(obj)).column_attrs if not attr.deferred}
+
+
+def not_found(model: Type[ModelType], identifier) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f'{model.__name__} с ИД {identifier} не найден.'
+    )
+
+
+def reservation_error(
+        model: Type[ModelType],
+        product: Optional[ModelType],
+        product_id: int,
+        amount_request: int) -> Optional[HTTPException]:
+    """
+    Возвращает ошибку для позиции заказа, которую не удалось зарезервировать:
+    продукта нет, количество не положительное или товара не хватает.
+    Если не хватает, пока часть шардов держат параллельные заказы,
+    ошибка 409 с Retry-After: после их фиксации товар может найтись.
+    """
+    if product is None:
+        return not_found(model, product_id)
+    if amount_request <= 0:
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                             detail=f'Для продукта {product.name} '
+                                    f'нужно указать значения 1 или выше')
+    if product.amount_left < amount_request and product.busy_shards:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=STOCK_BUSY.format(product.name, product_id),
+            headers={'Retry-After': str(STOCK_BUSY_RETRY_AFTER)})
+    if product.amount_left < amount_request:
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                             detail=f'Нет кол-во для {product.name}'
+                                    f' (ID: {product_id}). '
+                                    f'Доступно: {product.amount_left},'
+                                    f' Запрошено: {amount_request}')
+
+
+def order_outcome(status_code: int) -> str:
+    """
+    Метка для метрики итогов создания заказа.
+    """
+    return {
+        status.HTTP_201_CREATED: 'success',
+        status.HTTP_400_BAD_REQUEST: 'insufficient_stock',
+        status.HTTP_404_NOT_FOUND: 'product_not_found',
+        status.HTTP_409_CONFLICT: 'stock_busy',
+    }.get(status_code, 'error')
+
+
+def unnest_table(name: str, **arrays: List[int]):
+    """
+    Несколько целочисленных массивов как таблица unnest(...) AS name
+    с колонками по именам аргументов: так одним запросом передаются
+    значения для всех строк.
+    """
+    return func.unnest(*(
+        bindparam(f'{name}_{key}', values, type_=ARRAY(Integer))
+        for key, values in arrays.items())
+    ).table_valued(
+        *(column(key, Integer) for key in arrays)
+    ).render_derived(name=name)
+
+
+async def reserve_stock(
+        db: AsyncSession,
+        model: Type[ModelType],
+        amounts: Dict[int, int]) -> set:
+    """
+    Списывает остатки сразу по всем позициям одним запросом.
+    Сначала для каждой позиции ищется случайный шард остатка
+    (ProductStockShard), в котором хватает товара и который не заблокирован
+    другим заказом (FOR UPDATE SKIP LOCKED): заказы на популярный товар
+    расходятся по разным строкам и не ждут друг друга. Остальные позиции
+    списываются со строки products: строки блокируются в порядке id
+    (CTE с FOR NO KEY UPDATE: не мешает вставке позиций других заказов,
+    которые ссылаются на продукт), чтобы параллельные заказы не ловили
+    взаимоблокировки. Условия amount >= x проверяет сама БД, поэтому
+    два заказа не могут одновременно продать один и тот же остаток.
+    Возвращает множество ИД продуктов, по которым списание прошло.
+    """
+    ids = bindparam('ids', list(amounts), type_=ARRAY(Integer))
+    requested = unnest_table('requested', id=list(amounts),
+                             amount=list(amounts.values()))
+    requested = select(requested.c.id, requested.c.amount).cte('requested')
+    shard = ProductStockShard
+    candidate = (select(shard.shard)
+                 .where(shard.product_id == requested.c.id,
+                        shard.amount >= requested.c.amount)
+                 .order_by(func.random()).limit(1)
+                 .with_for_update(skip_locked=True)
+                 .lateral('candidate'))
+    picked = (select(requested.c.id, requested.c.amount, candidate.c.shard)
+              .join_from(requested, candidate, true()).cte('picked'))
+    from_shards = (update(shard)
+                   .where(shard.product_id == picked.c.id,
+                          shard.shard == picked.c.shard)
+                   .values(amount=shard.amount - picked.c.amount)
+                   .returning(shard.product_id).cte('from_shards'))
+    locked = (select(model.id)
+              .where(model.id == any_(ids),
+                     model.id.not_in(select(picked.c.id)))
+              .order_by(model.id).with_for_update(key_share=True)
+              .cte('locked'))
+    from_rows = (update(model)
+                 .where(model.id == requested.c.id,
+                        model.id == locked.c.id,
+                        model.amount_left >= requested.c.amount)
+                 .values(amount_left=model.amount_left - requested.c.amount)
+                 .returning(model.id).cte('from_rows'))
+    result = await db.execute(
+        select(from_shards.c.product_id).union_all(select(from_rows.c.id)))
+    reserved = set(result.scalars().all())
+    invalidate_after_commit(db, product_cache, reserved)
+    return reserved
+
+
+def split_evenly(total: int, parts: int) -> List[int]:
+    return [total // parts + (index < total % parts)
+            for index in range(parts)]
 
 
-async def filter_name(
+class StockLeft(NamedTuple):
+    name: str
+    # Полный остаток: amount_left продукта плюс заблокированные шарды.
+    amount_left: int
+    # Пары (шард, остаток) шардов, заблокированных этой транзакцией.
+    shards: Tuple[Tuple[int, int], ...] = ()
+    # Шардов, которые держат параллельные заказы.
+    busy_shards: int = 0
+
+
+async def lock_stock(
         db: AsyncSession,
         model: Type[ModelType],
-        item: ItemType,
-        statement):
+        product_ids: List[int]) -> Dict[int, StockLeft]:
     """
-    Функция, которая проверяет наличие такого же имени продукта.
+    Блокирует строки продуктов (FOR NO KEY UPDATE в порядке id) вместе
+    со всеми свободными шардами и возвращает остатки. Шарды, занятые
+    параллельными заказами, пропускаются (SKIP LOCKED), поэтому запрос
+    ждет только блокировки строк products. Занятые шарды не ждем
+    и под блокировками не повторяем: это могло бы дать взаимоблокировку
+    с заказами, которые держат шард и ждут строку products.
     """
+    shard = ProductStockShard
+    # Строки продуктов блокируются в CTE: так строка продукта захвачена
+    # раньше, чем его шарды. Иначе запрос, ждущий строку, успел бы
+    # занять свободные шарды, нужные владельцу строки.
+    products = (select(model.id, model.name, model.amount_left)
+                .where(model.id == any_(bindparam(
+                    'ids', sorted(product_ids), type_=ARRAY(Integer))))
+                .order_by(model.id).with_for_update(key_share=True)
+                .cte('locked_products'))
+    shards = (select(shard.shard, shard.amount)
+              .where(shard.product_id == products.c.id)
+              .order_by(shard.shard)
+              .with_for_update(skip_locked=True).lateral('shards'))
+    total_shards = (select(func.count())
+                    .where(shard.product_id == products.c.id)
+                    .scalar_subquery())
     result = await db.execute(
-        statement(model).filter(model.name == item.name))
+        select(products.c.id, products.c.name, products.c.amount_left,
+               total_shards.label('total_shards'),
+               shards.c.shard, shards.c.amount)
+        .outerjoin(shards, true())
+        .order_by(products.c.id, shards.c.shard))
+    stock = {}
+    for row in result:
+        left = stock.get(row.id, StockLeft(row.name, row.amount_left,
+                                           busy_shards=row.total_shards))
+        if row.shard is not None:
+            left = left._replace(
+                amount_left=left.amount_left + row.amount,
+                shards=left.shards + ((row.shard, row.amount),),
+                busy_shards=left.busy_shards - 1)
+        stock[row.id] = left
+    return stock
+
 
-    product_in_db = result.scalars().first()
-    if product_in_db:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                            detail=PRODUCT_EXISTS)
+async def store_stock(
+        db: AsyncSession,
+        model: Type[ModelType],
+        stock: Dict[int, StockLeft],
+        taken: Dict[int, int]):
+    """
+    Списывает taken с остатков, заблокированных lock_stock. Остаток
+    шардированного продукта заново делится поровну между его шардами
+    (перебалансировка), amount_left продукта обнуляется.
+    """
+    if not taken:
+        return
+    rows = {}
+    shard_rows = []
+    for product_id, amount in taken.items():
+        left = stock[product_id]
+        remaining = left.amount_left - amount
+        if left.shards:
+            shard_rows.extend(
+                (product_id, shard, amount) for (shard, _), amount
+                in zip(left.shards, split_evenly(remaining,
+                                                 len(left.shards))))
+            remaining = 0
+        rows[product_id] = remaining
+
+    values = unnest_table('stock', id=list(rows),
+                          amount=list(rows.values()))
+    await db.execute(
+        update(model).where(model.id == values.c.id)
+        .values(amount_left=values.c.amount)
+        .execution_options(synchronize_session=False))
+    if shard_rows:
+        product_ids, shards, amounts = zip(*shard_rows)
+        values = unnest_table('shards', product_id=list(product_ids),
+                              shard=list(shards), amount=list(amounts))
+        await db.execute(
+            update(ProductStockShard)
+            .where(ProductStockShard.product_id == values.c.product_id,
+                   ProductStockShard.shard == values.c.shard)
+            .values(amount=values.c.amount)
+            .execution_options(synchronize_session=False))
+    invalidate_after_commit(db, product_cache, rows)
+
+
+async def set_stock_shards(
+        db: AsyncSession,
+        model: Type[ModelType],
+        product_id: int,
+        shards: int):
+    """
+    Делит весь остаток продукта на shards строк ProductStockShard;
+    shards=0 возвращает остаток целиком в products.amount_left.
+    Ждет, пока параллельные заказы отпустят шарды продукта.
+    """
+    result = await db.execute(
+        select(model.amount_left).where(model.id == product_id)
+        .with_for_update())
+    amount_left = result.scalar_one_or_none()
+    if amount_left is None:
+        raise not_found(model, product_id)
+    result = await db.execute(
+        delete(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id)
+        .returning(ProductStockShard.amount))
+    total = amount_left + sum(result.scalars().all())
+    if shards:
+        await db.execute(insert(ProductStockShard), [
+            {'product_id': product_id, 'shard': shard, 'amount': amount}
+            for shard, amount in enumerate(split_evenly(total, shards))])
+    await db.execute(
+        update(model).where(model.id == product_id)
+        .values(amount_left=0 if shards else total)
+        .execution_options(synchronize_session=False))
+    invalidate_after_commit(db, product_cache, [product_id])
 
 
 async def check_product_amount_and_save(
@@ -78,22 +372,295 @@ async def check_product_amount_and_save(
     """
     Проверяет наличие достаточного количества товара на складе и сохраняет заказ.
     Если запрашиваемое количество превышает доступное, выбрасывается ошибка.
+    Остатки списываются одним запросом на все позиции, позиции заказа
+    вставляются одним многострочным INSERT. Фиксация транзакции остается
+    за вызывающим кодом.
+    """
+    product_dict = {int(product_id): amount
+                    for product_id, amount in product_dict.items()}
+    if not product_dict:
+        return
+    positive = {product_id: amount
+                for product_id, amount in product_dict.items() if amount > 0}
+    reserved = await reserve_stock(db, model, positive) if positive else set()
+
+    if len(reserved) < len(product_dict):
+        # Свободного шарда с нужным остатком не нашлось или товара нет:
+        # собираем весь остаток продукта и проверяем по нему.
+        rest = {product_id: amount_request
+                for product_id, amount_request in product_dict.items()
+                if product_id not in reserved}
+        stock = await lock_stock(db, model, list(rest))
+        for product_id, amount_request in rest.items():
+            error = reservation_error(model, stock.get(product_id),
+                                      product_id, amount_request)
+            if error:
+                raise error
+        await store_stock(db, model, stock, rest)
+
+    await db.execute(insert(save_model), [
+        {'order_id': order_id, 'product_id': product_id,
+         'amount_of_product': amount_request}
+        for product_id, amount_request in product_dict.items()
+    ])
+
+
+async def save_orders_batch(
+        db: AsyncSession,
+        model: Type[ModelType],
+        save_model: Type[ModelType],
+        order_model: Type[ModelType],
+        orders: List[Dict]) -> List[Dict]:
+    """
+    Сохраняет пачку заказов в одной транзакции за постоянное число запросов:
+    блокировка всех затронутых продуктов (FOR NO KEY UPDATE в порядке id)
+    вместе со свободными шардами остатка, одна запись остатков,
+    многострочные INSERT заказов и позиций.
+    Заказы проверяются по очереди на остатках в памяти, отклоненный заказ
+    не мешает остальным. Для каждого заказа возвращается словарь со
+    status_code и либо order, либо detail. Фиксация за вызывающим кодом.
+    """
+    orders = [
+        {'status': order['status'],
+         'products': {int(product_id): amount for product_id, amount
+                      in order['products'].items()}}
+        for order in orders
+    ]
+    demand = {}
+    for order in orders:
+        for product_id, amount_request in order['products'].items():
+            demand[product_id] = demand.get(product_id, 0) + amount_request
+    locked = await lock_stock(db, model, list(demand)) if demand else {}
+    stock = dict(locked)
+
+    results = []
+    accepted = []
+    totals = {}
+    for order in orders:
+        error = None
+        for product_id, amount_request in order['products'].items():
+            error = reservation_error(model, stock.get(product_id),
+                                      product_id, amount_request)
+            if error:
+                break
+        if error:
+            results.append({'status_code': error.status_code,
+                            'detail': error.detail,
+                            'headers': error.headers})
+            continue
+        for product_id, amount_request in order['products'].items():
+            stock[product_id] = stock[product_id]._replace(
+                amount_left=stock[product_id].amount_left - amount_request)
+            totals[product_id] = totals.get(product_id, 0) + amount_request
+        results.append({'status_code': status.HTTP_201_CREATED})
+        accepted.append((len(results) - 1, order))
+
+    if not accepted:
+        return results
+    await store_stock(db, model, locked, totals)
+    result = await db.execute(
+        insert(order_model).returning(order_model.id,
+                                      order_model.created_at,
+                                      sort_by_parameter_order=True),
+        [{'status': order['status']} for _, order in accepted])
+    items = []
+    for (index, order), row in zip(accepted, result.all()):
+        results[index]['order'] = {
+            'id': row.id,
+            'created_at': row.created_at,
+            'status': order['status'],
+            'products': order['products']
+        }
+        items.extend({'order_id': row.id, 'product_id': product_id,
+                      'amount_of_product': amount_request}
+                     for product_id, amount_request
+                     in order['products'].items())
+    if items:
+        await db.execute(insert(save_model), items)
+    return results
+
+
+async def set_orders_status(
+        db: AsyncSession,
+        model: Type[ModelType],
+        new_status: str,
+        ids: Optional[Sequence[int]] = None,
+        criteria: Sequence[Any] = ()) -> Tuple[int, List[int]]:
+    """
+    Меняет статус заказов одним UPDATE: по списку id
+    (id = ANY(массив)) или по условиям order_filters. Возвращает число
+    измененных заказов и отсутствующие id из списка. Фиксация за
+    вызывающим кодом.
+    """
+    statement = update(model).values(status=new_status).execution_options(
+        synchronize_session=False)
+    if ids is None:
+        result = await db.execute(statement.where(*criteria))
+        return result.rowcount, []
+    result = await db.execute(
+        statement.where(model.id == any_(bindparam(
+            'ids', list(ids), type_=ARRAY(Integer))))
+        .returning(model.id))
+    updated = set(result.scalars().all())
+    return len(updated), sorted(set(ids) - updated)
+
+
+def order_filters(
+        order_status: Optional[str] = None,
+        created_from: Optional[datetime.datetime] = None,
+        created_to: Optional[datetime.datetime] = None,
+        product_id: Optional[int] = None) -> List[Any]:
+    """
+    Условия выборки заказов. Статус с периодом обслуживает индекс
+    ix_orders_status_created_at, товар - EXISTS по ix_order_items_product_id.
+    """
+    criteria = []
+    if order_status is not None:
+        criteria.append(Order.status == order_status)
+    if created_from is not None:
+        criteria.append(Order.created_at >= to_naive_utc(created_from))
+    if created_to is not None:
+        criteria.append(Order.created_at < to_naive_utc(created_to))
+    if product_id is not None:
+        criteria.append(Order.order_items.any(
+            OrderItem.product_id == product_id))
+    return criteria
+
+
+async def paginate(
+        db: AsyncSession,
+        model: Type[ModelType],
+        statement: Select,
+        limit: int,
+        cursor: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Постраничная выборка по ключу (keyset) на поле id.
+    Вместо OFFSET используется условие id > cursor, поэтому стоимость
+    страницы не зависит от глубины курсора. Выбирается limit + 1 строка,
+    чтобы без отдельного COUNT понять, есть ли следующая страница.
+    """
+    if cursor is not None:
+        statement = statement.where(model.id > cursor)
+    result = await db.execute(
+        statement.order_by(model.id).limit(limit + 1))
+    items = result.scalars().all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1].id
+    return {'items': items, 'next_cursor': next_cursor}
+
+
+def like_pattern(value: str) -> str:
+    """Экранирует спецсимволы LIKE, чтобы строка искалась буквально."""
+    return (value.replace('\\', '\\\\').replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+async def search_products(
+        db: AsyncSession,
+        model: Type[ModelType],
+        query: str,
+        limit: int,
+        cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Поиск продуктов: полнотекстовое совпадение по названию и описанию
+    (GIN-индекс по search_document) или подстрока в названии
+    (ILIKE, триграммный индекс). Порядок - по убыванию релевантности:
+    ts_rank_cd плюс бонус за название, начинающееся с запроса.
+    Курсор - пара "score:id" последней строки, страница выбирается
+    по ключу (score, id), как в paginate, без OFFSET.
+    Совпадения каждого вида ищутся отдельным запросом по своему индексу
+    (OR двух условий свел бы план к просмотру таблицы), и из каждого
+    берутся MAX_SEARCH_CANDIDATES самых релевантных по дешевой оценке:
+    ts_rank без учета близости слов и триграммная similarity названия.
+    Полное ранжирование считается только для них, поэтому выдача
+    частого слова заканчивается на этих кандидатах. Подстрока короче
+    MIN_SUBSTRING_SEARCH не ищется: для нее триграммный индекс
+    не работает и запрос просмотрел бы всю таблицу.
+    """
+    document = model.search_document
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+    pattern = like_pattern(query)
+    branches = [
+        select(model.id).where(document.op('@@')(tsquery))
+        .order_by(func.ts_rank(document, tsquery).desc(), model.id)
+        .limit(MAX_SEARCH_CANDIDATES)]
+    if len(query) >= MIN_SUBSTRING_SEARCH:
+        branches.append(
+            select(model.id).where(model.name.ilike('%' + pattern + '%'))
+            .order_by(func.similarity(model.name, query).desc(), model.id)
+            .limit(MAX_SEARCH_CANDIDATES))
+    candidates = union(*branches).cte('candidates')
+    score = cast(
+        func.ts_rank_cd(document, tsquery)
+        + case((model.name.ilike(pattern + '%'), 1), else_=0), Double)
+    statement = (
+        select(model, score.label('score'))
+        .join(candidates, candidates.c.id == model.id)
+    )
+    if cursor is not None:
+        last_score, _, last_id = cursor.partition(':')
+        last_score = float(last_score)
+        statement = statement.where(or_(
+            score < last_score,
+            and_(score == last_score, model.id > int(last_id))))
+    result = await db.execute(
+        statement.order_by(score.desc(), model.id).limit(limit + 1))
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f'{rows[-1].score!r}:{rows[-1][0].id}'
+    return {'items': [snapshot(row[0]) for row in rows],
+            'next_cursor': next_cursor}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Проверка заголовка If-None-Match (слабое сравнение, RFC 9110).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = {tag.strip().removeprefix('W/')
+                  for tag in if_none_match.split(',')}
+    return etag.removeprefix('W/') in candidates
+
+
+def object_etag(obj: Dict[str, Any]) -> str:
+    # Списание с шарда не меняет version продукта, поэтому в теге
+    # есть и полный остаток.
+    return f'W/"{obj["id"]}.{obj["version"]}.{obj["amount_available"]}"'
+
+
+async def collection_etag(
+        db: AsyncSession,
+        model: Type[ModelType],
+        query_string: str = '',
+        extra: Sequence = ()) -> str:
+    """
+    ETag списка: max(version) растет при любой вставке или изменении,
+    count(*) меняется при удалении. Параметры запроса входят в тег,
+    так как от них зависит содержимое страницы. extra - дополнительные
+    скалярные выражения, от которых зависит список.
+    """
+    result = await db.execute(
+        select(func.max(model.version), func.count(), *extra)
+        .select_from(model))
+    max_version, count, *values = result.one()
+    params = zlib.crc32(query_string.encode())
+    tag = '.'.join(str(value) for value in (max_version or 0, count,
+                                            *values))
+    return f'W/"{tag}.{params:x}"'
+
+
+def to_naive_utc(value: Optional[datetime.datetime]):
+    """
+    Приводит дату к UTC без tzinfo: колонки created_at хранятся
+    как timestamp without time zone.
     """
-    for product_id, amount_request in product_dict.items():
-        product = await get_or_404(db, model, product_id)
-        if amount_request <= 0:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail=f'Для продукта {product.name} '
-                                       f'нужно указать значения 1 или выше')
-        if product.amount_left < amount_request:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                detail=f'Нет кол-во для {product.name}'
-                                       f' (ID: {product_id}). '
-                                       f'Доступно: {product.amount_left},'
-                                       f' Запрошено: {amount_request}')
-        order_item = save_model(order_id=order_id, product_id=int(product_id),
-                                amount_of_product=amount_request)
-        db.add(order_item)
-        product.amount_left -= amount_request
-        db.add(product)
-    await db.commit()
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.UTC).replace(tzinfo=None)
@@ -1,7 +1,14 @@
+import asyncio
 import contextlib
-import os
-from typing import Any, AsyncIterator
+import itertools
+import time
+from typing import (Any, AsyncContextManager, AsyncIterator, Optional,
+                    Sequence)
 
+import asyncpg
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
     AsyncSession,
@@ -9,30 +16,106 @@ from sqlalchemy.ext.asyncio import (
     create_async_engine,
 )
 from sqlalchemy.orm import declarative_base
-from dotenv import load_dotenv
-
-load_dotenv()
 
 Base = declarative_base()
 
+READ_PRIMARY_HEADER = 'X-Read-Primary'
+READ_PRIMARY_COOKIE = 'read_primary_until'
+# Ключ session.info у сессий реплик: сколько секунд их данные могут
+# отставать от primary.
+REPLICA_SESSION = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
 
 # Взято за основу с этой статьи:
 # https://praciano.com.br/fastapi-and-async-sqlalchemy-20-with-pytest-done-right.html
 
 
 class DatabaseSessionManager:
-    def __init__(self, host: str, engine_kwargs: dict[str, Any] = None):
-        self._engine = create_async_engine(host, **engine_kwargs)
+    def __init__(self, host: Optional[str] = None,
+                 engine_kwargs: dict[str, Any] = None,
+                 replica_hosts: Sequence[str] = (),
+                 replica_retry_seconds: float = 5.0,
+                 read_sticky_seconds: float = 5.0):
+        self._engine = None
+        self._sessionmaker = None
+        self._replica_engines = []
+        self._replica_sessionmakers = []
+        self._replica_down_until = []
+        self._replica_cycle = itertools.count()
+        self.replica_retry_seconds = replica_retry_seconds
+        self.read_sticky_seconds = read_sticky_seconds
+        if host is not None:
+            self.init(host, engine_kwargs, replica_hosts)
+
+    def init(self, host: str, engine_kwargs: dict[str, Any] = None,
+             replica_hosts: Sequence[str] = (), *,
+             replica_retry_seconds: Optional[float] = None,
+             read_sticky_seconds: Optional[float] = None):
+        """
+        Создает движки primary и реплик. Вызывается из lifespan приложения,
+        а не при импорте: так каждый воркер получает собственный пул.
+        """
+        if replica_retry_seconds is not None:
+            self.replica_retry_seconds = replica_retry_seconds
+        if read_sticky_seconds is not None:
+            self.read_sticky_seconds = read_sticky_seconds
+        self._engine = create_async_engine(host, **(engine_kwargs or {}))
         self._sessionmaker = async_sessionmaker(autocommit=False,
                                                 bind=self._engine)
+        self._replica_engines = [
+            create_async_engine(replica, **(engine_kwargs or {}))
+            for replica in replica_hosts]
+        self._replica_sessionmakers = [
+            async_sessionmaker(autocommit=False, bind=engine)
+            for engine in self._replica_engines]
+        self._replica_down_until = [0.0] * len(self._replica_engines)
+
+    async def warmup(self, connections: int = 1):
+        """
+        Открывает connections соединений одновременно и возвращает их в
+        пул, чтобы первые запросы не платили за установку соединения.
+        """
+        if self._engine is None:
+            raise Exception('DatabaseSessionManager не инициализирована')
+        await asyncio.gather(*(self._warmup_engine(engine, connections)
+                               for engine in self.engines))
+
+    @property
+    def has_replicas(self) -> bool:
+        return bool(self._replica_engines)
+
+    @property
+    def engines(self) -> list:
+        if self._engine is None:
+            return []
+        return [self._engine, *self._replica_engines]
+
+    @staticmethod
+    async def _warmup_engine(engine, connections: int):
+        async with contextlib.AsyncExitStack() as stack:
+            opened = await asyncio.gather(
+                *(stack.enter_async_context(engine.connect())
+                  for _ in range(connections)),
+                return_exceptions=True)
+            errors = [item for item in opened
+                      if isinstance(item, BaseException)]
+            if errors:
+                raise errors[0]
+            await asyncio.gather(*(connection.execute(text('SELECT 1'))
+                                   for connection in opened))
 
     async def close(self):
         if self._engine is None:
             raise Exception('DatabaseSessionManager не инициализирована')
-        await self._engine.dispose()
+        for engine in self.engines:
+            await engine.dispose()
 
         self._engine = None
         self._sessionmaker = None
+        self._replica_engines = []
+        self._replica_sessionmakers = []
+        self._replica_down_until = []
 
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
@@ -46,6 +129,25 @@ class DatabaseSessionManager:
                 await connection.rollback()
                 raise
 
+    @contextlib.asynccontextmanager
+    async def driver_connection(self) -> AsyncIterator[Any]:
+        """
+        Отдельное соединение asyncpg с primary мимо пула: для LISTEN.
+        Оно держится все время работы воркера и не должно занимать место
+        соединений запросов. Транзакция не открывается: уведомления
+        приходят только вне транзакции.
+        """
+        if self._engine is None:
+            raise Exception('DatabaseSessionManager не инициализирована')
+
+        url = self._engine.url.set(drivername='postgresql')
+        connection = await asyncpg.connect(
+            url.render_as_string(hide_password=False))
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
     @contextlib.asynccontextmanager
     async def session(self) -> AsyncIterator[AsyncSession]:
         if self._sessionmaker is None:
@@ -60,11 +162,119 @@ class DatabaseSessionManager:
         finally:
             await session.close()
 
+    @contextlib.asynccontextmanager
+    async def read_session(
+            self, primary: bool = False) -> AsyncIterator[AsyncSession]:
+        """
+        Сессия только для чтения. Реплики выбираются по кругу; если
+        подключиться к реплике не удалось, она пропускается на
+        replica_retry_seconds, а запрос уходит на следующую или на primary.
+        """
+        if self._sessionmaker is None:
+            raise Exception('DatabaseSessionManager не инициализирована')
+
+        session = None if primary else await self._replica_session()
+        if session is None:
+            session = self._sessionmaker()
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    async def _replica_session(self) -> Optional[AsyncSession]:
+        count = len(self._replica_sessionmakers)
+        if not count:
+            return None
+        start = next(self._replica_cycle)
+        for offset in range(count):
+            index = (start + offset) % count
+            if self._replica_down_until[index] > time.monotonic():
+                continue
+            session = self._replica_sessionmakers[index]()
+            session.info[REPLICA_SESSION] = self.read_sticky_seconds
+            try:
+                await session.connection()
+                return session
+            except (OSError, DBAPIError, asyncio.TimeoutError):
+                await session.close()
+                self._replica_down_until[index] = (
+                    time.monotonic() + self.replica_retry_seconds)
+        return None
+
 
-sessionmanager = DatabaseSessionManager(
-    os.getenv('DATABASE_URL'), {'echo': True})
+sessionmanager = DatabaseSessionManager()
 
 
-async def get_db():
+async def get_db(request: Request, response: Response):
+    """
+    Сессия primary. После изменяющего запроса клиенту ставится кука,
+    по которой его чтения еще read_sticky_seconds идут на primary
+    (read-your-writes при асинхронной репликации).
+    """
+    if request.method not in SAFE_METHODS and sessionmanager.has_replicas:
+        until = time.time() + sessionmanager.read_sticky_seconds
+        response.set_cookie(READ_PRIMARY_COOKIE, f'{until:.3f}',
+                            max_age=int(sessionmanager.read_sticky_seconds)
+                            + 1, httponly=True)
     async with sessionmanager.session() as session:
         yield session
+
+
+def replica_lag(session: AsyncSession) -> float:
+    """
+    На сколько секунд может отставать прочитанное сессией: 0 для primary,
+    для реплики - read_sticky_seconds (то же допущение, по которому
+    клиент после записи читает с primary). Передается в lag при
+    заполнении общих кэшей.
+    """
+    return session.info.get(REPLICA_SESSION, 0.0)
+
+
+def wants_primary(request: Request) -> bool:
+    if request.headers.get(READ_PRIMARY_HEADER, '').lower() in ('1', 'true'):
+        return True
+    try:
+        until = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+async def get_read_db(request: Request):
+    """
+    Сессия для обработчиков только на чтение: реплика, если она есть
+    и клиент не просил читать с primary.
+    """
+    async with sessionmanager.read_session(
+            primary=wants_primary(request)) as session:
+        yield session
+
+
+class ReadSessionFactory:
+    """
+    Сессия только для чтения по требованию: в отличие от get_read_db,
+    соединение не берется, пока обработчик сам не откроет сессию.
+    """
+
+    def __init__(self, manager: DatabaseSessionManager,
+                 primary: bool = False):
+        self.manager = manager
+        self.primary = primary
+
+    def __call__(self) -> AsyncContextManager[AsyncSession]:
+        return self.manager.read_session(primary=self.primary)
+
+
+def get_read_session_factory(request: Request) -> ReadSessionFactory:
+    return ReadSessionFactory(sessionmanager, wants_primary(request))
+
+
+def get_sessionmanager() -> DatabaseSessionManager:
+    """
+    Для обработчиков, которым соединение нужно дольше, чем живет
+    зависимость get_db (например, потоковые ответы).
+    """
+    return sessionmanager
@@ -0,0 +1,140 @@
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.models.cache import TTLCache
+from app.core.models.database import DatabaseSessionManager
+from app.core.models.models import IdempotencyKey
+from app.v1.api.constants import IDEMPOTENCY_MISMATCH
+
+logger = logging.getLogger(__name__)
+
+# key -> (request_hash, response): ключи этого воркера и прочитанные из БД.
+idempotency_cache = TTLCache(maxsize=settings.idempotency_cache_size,
+                             ttl=settings.idempotency_ttl)
+# key -> future запроса, который сейчас выполняется с этим ключом.
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def request_hash(body: Any) -> str:
+    payload = json.dumps(jsonable_encoder(body), sort_keys=True,
+                         separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _expired_before() -> Any:
+    return func.now() - datetime.timedelta(seconds=settings.idempotency_ttl)
+
+
+@contextlib.asynccontextmanager
+async def single_flight(key: str):
+    """
+    Пропускает в блок один запрос на ключ в пределах воркера: повтор,
+    пришедший во время выполнения первого, ждет его завершения, а затем
+    находит сохраненный ответ (или выполняется сам, если первый упал).
+    """
+    while (future := _in_flight.get(key)) is not None:
+        await asyncio.shield(future)
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        yield
+    finally:
+        del _in_flight[key]
+        future.set_result(None)
+
+
+async def find_response(
+        db: AsyncSession,
+        key: str) -> Optional[Tuple[str, Dict]]:
+    """
+    Сохраненные (request_hash, response) по ключу: сначала из кэша
+    воркера, затем из таблицы idempotency_keys.
+    """
+    stored = idempotency_cache.get(key)
+    if stored is not None:
+        return stored
+    result = await db.execute(
+        select(IdempotencyKey.request_hash, IdempotencyKey.response)
+        .where(IdempotencyKey.key == key,
+               IdempotencyKey.created_at >= _expired_before()))
+    row = result.one_or_none()
+    if row is None:
+        return None
+    stored = (row.request_hash, row.response)
+    idempotency_cache.set(key, stored)
+    return stored
+
+
+def replay(stored: Tuple[str, Dict], fingerprint: str) -> Dict:
+    stored_hash, response = stored
+    if stored_hash != fingerprint:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=IDEMPOTENCY_MISMATCH)
+    return response
+
+
+async def remember_response(
+        db: AsyncSession,
+        key: str,
+        fingerprint: str,
+        response: Dict) -> Optional[Tuple[str, Dict]]:
+    """
+    Записывает ответ по ключу в текущей транзакции. Устаревшая строка
+    с тем же ключом перезаписывается. Возвращает то, что нужно положить
+    в кэш после фиксации, или None, если ключ уже занят другим
+    запросом (на другом воркере): тогда транзакцию нужно откатить.
+    """
+    response = jsonable_encoder(response)
+    statement = insert(IdempotencyKey).values(
+        key=key, request_hash=fingerprint, response=response)
+    statement = statement.on_conflict_do_update(
+        index_elements=[IdempotencyKey.key],
+        set_={'request_hash': statement.excluded.request_hash,
+              'response': statement.excluded.response,
+              'created_at': func.now()},
+        where=IdempotencyKey.created_at < _expired_before()
+    ).returning(IdempotencyKey.key)
+    result = await db.execute(statement)
+    if result.scalar_one_or_none() is None:
+        return None
+    return fingerprint, response
+
+
+async def purge_expired(db: AsyncSession) -> int:
+    result = await db.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.created_at < _expired_before()))
+    return result.rowcount
+
+
+async def purge_expired_periodically(manager: DatabaseSessionManager,
+                                     interval: float):
+    """
+    Фоновая задача воркера: раз в interval секунд удаляет устаревшие
+    ключи. Ошибка не останавливает задачу, попытка повторится:
+    недоступность БД ожидаема, остальные ошибки пишутся в лог.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with manager.session() as session:
+                await purge_expired(session)
+                await session.commit()
+        except (DBAPIError, OSError):
+            pass
+        except Exception:
+            logger.exception('Не удалось удалить устаревшие '
+                             'ключи идемпотентности')
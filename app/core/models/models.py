@@ -1,18 +1,37 @@
 from datetime import datetime
 
 from sqlalchemy import (Integer, String, Text, ForeignKey, DECIMAL,
-                        DateTime, func, UniqueConstraint, CheckConstraint)
-from sqlalchemy.orm import relationship, Mapped, mapped_column
+                        DateTime, func, UniqueConstraint, CheckConstraint,
+                        BigInteger, Sequence, text, select, Index,
+                        Computed, literal_column, DDL, event)
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import (relationship, Mapped, mapped_column,
+                            column_property)
 
 from .database import Base
 
 
+# Общая для всех продуктов последовательность версий: любая вставка или
+# изменение продукта получает новое, большее прежних значение. Поэтому
+# max(version) вместе с count(*) однозначно меняется при любой правке каталога.
+product_version_seq = Sequence('products_version_seq', metadata=Base.metadata)
+
+# Конфигурация 'simple' не зависит от языка: названия товаров смешивают
+# русский, английский и артикулы.
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+
+
 class Product(Base):
     """
     Класс для представления продукта. Содержит поля:
-    id, name, description, price, amount_left и связь с OrderItem.
+    id, name, description, price, amount_left, version и связь с OrderItem.
     Обеспечивает уникальность имени и проверку на положительные
-    значения цены и количества.
+    значения цены и количества. version обновляется при каждом
+    UPDATE и используется для ETag. Остаток популярного товара может
+    быть разнесен по строкам ProductStockShard, тогда полный остаток -
+    amount_available. search_document - вычисляемый в БД tsvector
+    названия и описания для поиска, подстрока в названии ищется по
+    триграммному индексу (нужно расширение pg_trgm).
     """
 
     __tablename__ = 'products'
@@ -20,6 +39,10 @@ class Product(Base):
         UniqueConstraint('name', name='unique_name'),
         CheckConstraint('price > 0', name='check_price'),
         CheckConstraint('amount_left >= 0', name='check_amount'),
+        Index('ix_products_search_document', 'search_document',
+              postgresql_using='gin'),
+        Index('ix_products_name_trgm', 'name', postgresql_using='gin',
+              postgresql_ops={'name': 'gin_trgm_ops'}),
     )
 
     id: Mapped[int] = mapped_column(
@@ -29,9 +52,25 @@ class Product(Base):
     description: Mapped[str] = mapped_column(Text, nullable=True)
     price: Mapped[float] = mapped_column(DECIMAL(10, 2), nullable=False)
     amount_left: Mapped[int] = mapped_column(Integer, nullable=False)
-
+    version: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, index=True,
+        server_default=text(f"nextval('{product_version_seq.name}')"),
+        onupdate=product_version_seq.next_value())
+    # Хранимая колонка: ранжирование не пересчитывает to_tsvector на
+    # каждую найденную строку. deferred - в обычные выборки не попадает.
+    search_document: Mapped[str] = mapped_column(
+        TSVECTOR, Computed("to_tsvector('simple'::regconfig, "
+                           "name || ' ' || coalesce(description, ''))",
+                           persisted=True),
+        deferred=True)
+
+    # passive_deletes: позиции удаляет ON DELETE CASCADE в БД,
+    # ORM не загружает их перед удалением продукта.
     order_items: Mapped[list['OrderItem']] = relationship(
-        'OrderItem', back_populates='product', cascade='all, delete-orphan')
+        'OrderItem', back_populates='product', cascade='all, delete-orphan',
+        passive_deletes=True)
+
+    __mapper_args__ = {'eager_defaults': True}
 
     def __repr__(self):
         return (f'<Product(id={self.id}, name="{self.name}",'
@@ -42,6 +81,11 @@ class Product(Base):
                 f'Price: {self.price}, Stock: {self.amount_left}')
 
 
+# Класс операторов gin_trgm_ops для ix_products_name_trgm - из pg_trgm.
+event.listen(Product.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+
 class Order(Base):
     """
     Класс для представления заказа. Содержит поля:
@@ -50,6 +94,10 @@ class Order(Base):
     """
 
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Выборки вида "заказы в статусе X за последний час".
+        Index('ix_orders_status_created_at', 'status', 'created_at'),
+    )
 
     id: Mapped[int] = mapped_column(
         Integer, primary_key=True, autoincrement=True)
@@ -58,7 +106,8 @@ class Order(Base):
     status: Mapped[str] = mapped_column(
         String(55), nullable=False, default='В процессе')
     order_items: Mapped[list['OrderItem']] = relationship(
-        'OrderItem', back_populates='order', cascade='all, delete-orphan')
+        'OrderItem', back_populates='order', cascade='all, delete-orphan',
+        passive_deletes=True)
 
     def __repr__(self):
         return (f'<Order(id={self.id}, status="{self.status}",'
@@ -87,8 +136,10 @@ class OrderItem(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     order_id: Mapped[int] = mapped_column(
         ForeignKey('orders.id', ondelete='CASCADE'))
+    # Индекс по order_id дает unique_order_product, по product_id нужен
+    # отдельный: каскадное удаление продукта и поиск заказов с товаром.
     product_id: Mapped[int] = mapped_column(
-        ForeignKey('products.id',  ondelete='CASCADE'))
+        ForeignKey('products.id',  ondelete='CASCADE'), index=True)
     amount_of_product: Mapped[int] = mapped_column(Integer, nullable=False)
 
     order: Mapped['Order'] = relationship('Order',
@@ -106,3 +157,56 @@ class OrderItem(Base):
         return (f'OrderItem #{self.id} - Order #{self.order_id}, '
                 f'Product: "{product_name}",'
                 f' Quantity: {self.amount_of_products}')
+
+
+class ProductStockShard(Base):
+    """
+    Часть остатка продукта (шард). Для популярного товара остаток
+    делится на несколько строк, и параллельные заказы списывают
+    каждый со своей строки, а не ждут блокировку одной строки products.
+    Полный остаток продукта - amount_left плюс сумма amount по шардам.
+    """
+
+    __tablename__ = 'product_stock_shards'
+    __table_args__ = (
+        CheckConstraint('amount >= 0', name='check_shard_amount'),
+    )
+
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    amount: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    def __repr__(self):
+        return (f'<ProductStockShard(product_id={self.product_id}, '
+                f'shard={self.shard}, amount={self.amount})>')
+
+
+Product.amount_available = column_property(
+    Product.amount_left + select(
+        func.coalesce(func.sum(ProductStockShard.amount), 0))
+    .where(ProductStockShard.product_id == Product.id)
+    .correlate_except(ProductStockShard)
+    .scalar_subquery())
+
+
+class IdempotencyKey(Base):
+    """
+    Ответ на создание заказа, сохраненный по заголовку Idempotency-Key.
+    Строка вставляется в той же транзакции, что и заказ, поэтому ключ
+    есть в таблице тогда и только тогда, когда заказ зафиксирован.
+    request_hash - отпечаток тела запроса: тот же ключ с другим телом
+    отклоняется. Устаревшие ключи удаляются по created_at.
+    """
+
+    __tablename__ = 'idempotency_keys'
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    response: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, server_default=func.now(), nullable=False, index=True)
+
+    def __repr__(self):
+        return (f'<IdempotencyKey(key="{self.key}",'
+                f' created_at={self.created_at})>')
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import Counter, registry
+from app.core.models.database import ReadSessionFactory
+
+T = TypeVar('T')
+
+coalesced_reads = registry.register(Counter(
+    'coalesced_reads_total',
+    'Чтения через single-flight: leader идет в БД, follower ждет его.',
+    ('kind', 'role')))
+
+
+class SingleFlight:
+    """
+    Одновременные одинаковые чтения выполняются один раз: первый вызов
+    с ключом запускает задачу, остальные до ее завершения получают тот же
+    результат или то же исключение. Задача не принадлежит ни одному
+    запросу, так что отключение первого клиента не отменяет чтение
+    для остальных.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable,
+                 function: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.create_task(function())
+            task.add_done_callback(lambda _: self._forget(key, task))
+            coalesced_reads.inc(key[0], 'leader')
+        else:
+            coalesced_reads.inc(key[0], 'follower')
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+
+read_flight = SingleFlight()
+
+
+async def read_once(
+        key: tuple, sessions: ReadSessionFactory,
+        read: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    """
+    Чтение через read_flight. Ключ - (вид, параметры...); сессию, а с
+    ней и соединение пула, открывает только leader. Чтение с primary
+    (клиент читает после своей записи) не объединяется: чужое чтение,
+    начатое до этой записи, могло бы ее не увидеть.
+    """
+    async def leader():
+        async with sessions() as db:
+            return await read(db)
+
+    if sessions.primary:
+        return await leader()
+    return await read_flight.do(key, leader)
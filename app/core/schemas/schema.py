@@ -1,12 +1,13 @@
 import datetime
 from decimal import Decimal
-from typing import Dict, Annotated
+from typing import Dict, Annotated, List, Optional
 
-from pydantic import BaseModel, fields, conint, ConfigDict
+from pydantic import AliasChoices, BaseModel, fields, conint, ConfigDict
 
 from app.v1.api.constants import (REGEX, DESCRIPTION_AMOUNT_PRODUCTS,
                                   EXAMPLE_PRODUCTS, DESCRIPTION_PRODUCTS,
-                                  DESCRIPTION_STATUS)
+                                  DESCRIPTION_STATUS, MAX_STOCK_SHARDS,
+                                  DESCRIPTION_SHARDS, MAX_STATUS_ORDERS)
 
 
 class BaseConfigModel(BaseModel):
@@ -25,7 +26,18 @@ class ProductGet(BaseConfigModel):
     name: str
     description: str
     price: float
-    amount_left: int
+    # Полный остаток, включая шарды (Product.amount_available).
+    amount_left: int = fields.Field(
+        validation_alias=AliasChoices('amount_available', 'amount_left'))
+
+
+class ProductShardsUpdate(BaseConfigModel):
+    shards: int = fields.Field(ge=0, le=MAX_STOCK_SHARDS,
+                               description=DESCRIPTION_SHARDS)
+
+
+class ProductImportResult(BaseConfigModel):
+    rows: int
 
 
 class OrderCreate(BaseConfigModel):
@@ -47,6 +59,47 @@ class OrderGet(BaseConfigModel):
         default_factory=dict, examples=[EXAMPLE_PRODUCTS])
 
 
+class OrderBatchResult(BaseConfigModel):
+    status_code: int
+    order: Optional[OrderGet] = None
+    detail: Optional[str] = None
+
+
 class OrderStatusUpdate(BaseConfigModel):
     status: str = fields.Field(min_length=5, default='в процессе',
                                pattern=REGEX, description=DESCRIPTION_STATUS)
+
+
+class OrderFilter(BaseConfigModel):
+    status: Optional[str] = fields.Field(None, pattern=REGEX,
+                                         description=DESCRIPTION_STATUS)
+    created_from: Optional[datetime.datetime] = None
+    created_to: Optional[datetime.datetime] = None
+    product_id: Optional[int] = fields.Field(None, ge=1)
+
+
+class OrderStatusBulkUpdate(BaseConfigModel):
+    status: str = fields.Field(pattern=REGEX, description=DESCRIPTION_STATUS)
+    ids: Optional[List[int]] = fields.Field(
+        None, min_length=1, max_length=MAX_STATUS_ORDERS)
+    filter: Optional[OrderFilter] = None
+
+
+class OrderStatusBulkResult(BaseConfigModel):
+    updated: int
+    not_found: List[int] = fields.Field(default_factory=list)
+
+
+class ProductPage(BaseConfigModel):
+    items: List[ProductGet]
+    next_cursor: Optional[int] = None
+
+
+class ProductSearchPage(BaseConfigModel):
+    items: List[ProductGet]
+    next_cursor: Optional[str] = None
+
+
+class OrderPage(BaseConfigModel):
+    items: List[OrderGet]
+    next_cursor: Optional[int] = None
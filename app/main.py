@@ -1,17 +1,56 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 import uvicorn
 from fastapi import FastAPI
 
-from app.v1.api.endpoints import products, orders
-from app.v1.api import api
+from app.v1.api.endpoints import products, orders, service
+from app.v1.api import api, service as service_api
+from app.core.admission import AdmissionMiddleware
+from app.core.config import settings
+from app.core.metrics import (MetricsMiddleware, InstrumentedQueuePool,
+                              instrument_engine, forget_engines)
+from app.core.models.batcher import order_batcher
+from app.core.models.changes import product_changes
 from app.core.models.database import sessionmanager
+from app.core.models.idempotency import purge_expired_periodically
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    database = settings.database
+    if sessionmanager._engine is None:
+        sessionmanager.init(
+            database.url,
+            {**database.engine_kwargs(), 'poolclass': InstrumentedQueuePool},
+            database.replica_urls,
+            replica_retry_seconds=database.replica_retry_seconds,
+            read_sticky_seconds=database.read_sticky_seconds)
+        for index, engine in enumerate(sessionmanager.engines):
+            instrument_engine(
+                engine, 'primary' if index == 0 else f'replica{index - 1}')
+        await sessionmanager.warmup(
+            min(database.warmup_connections, database.pool_size))
+    if settings.order_batching:
+        order_batcher.start(sessionmanager,
+                            max_batch=settings.order_batch_size,
+                            window=settings.order_batch_window_ms / 1000)
+    product_changes.start(sessionmanager,
+                          window=settings.stock_stream_window_ms / 1000)
+    cleanup = asyncio.create_task(purge_expired_periodically(
+        sessionmanager, settings.idempotency_cleanup_interval))
+    # Пул прогрет и фоновые задачи запущены: /health/ready отвечает 200
+    app.state.ready = True
     yield
+    app.state.ready = False
+    cleanup.cancel()
+    # Очистка может быть посреди запроса: дожидаемся ее до закрытия пула
+    with suppress(asyncio.CancelledError):
+        await cleanup
+    await order_batcher.stop()
+    await product_changes.stop()
     if sessionmanager._engine is not None:
+        forget_engines()
         await sessionmanager.close()
 
 
@@ -19,10 +58,19 @@ app = FastAPI(lifespan=lifespan, title='Склад', docs_url='/api/docs',
               redoc_url='/api/redoc')
 
 api_start = api
+service_start = service_api
 
+if settings.admission.enabled:
+    # Внутри MetricsMiddleware: отказы тоже попадают в метрики запросов
+    app.add_middleware(AdmissionMiddleware, router=app.router,
+                       settings=settings.admission)
+app.add_middleware(MetricsMiddleware)
 app.include_router(products)
 app.include_router(orders)
+app.include_router(service)
 
 
 if __name__ == '__main__':
-    uvicorn.run('main:app', host='0.0.0.0', reload=True, port=8000)
+    # Для разработки: один процесс с автоперезагрузкой. Боевой запуск -
+    # python -m app.server.
+    uvicorn.run('app.main:app', host='0.0.0.0', reload=True, port=8000)
@@ -0,0 +1,43 @@
+import argparse
+
+import uvicorn
+
+from app.core.config import settings
+
+APP = 'app.main:app'
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    server = settings.server
+    parser = argparse.ArgumentParser(
+        description='Боевой запуск: несколько воркеров uvicorn.')
+    parser.add_argument('--host', default=server.host)
+    parser.add_argument('--port', type=int, default=server.port)
+    parser.add_argument('--workers', type=int, default=server.workers,
+                        help='Число процессов, по умолчанию по ядрам')
+    parser.add_argument('--graceful-timeout', type=float,
+                        default=server.graceful_timeout,
+                        help='Сколько секунд дожидаться запросов '
+                             'при остановке')
+    return parser.parse_args(argv)
+
+
+def run(args: argparse.Namespace):
+    """
+    Каждый воркер - отдельный процесс со своим lifespan: движки БД
+    создаются и прогреваются уже после fork, так что соединения
+    пулов между процессами не делятся. uvloop и httptools подключаются,
+    если установлены (loop и http 'auto'). По SIGTERM uvicorn перестает
+    принимать соединения, ждет текущие запросы до graceful_timeout и
+    только затем выполняет завершение lifespan с sessionmanager.close().
+    """
+    server = settings.server
+    uvicorn.run(APP, host=args.host, port=args.port, workers=args.workers,
+                loop='auto', http='auto', proxy_headers=True,
+                backlog=server.backlog,
+                timeout_keep_alive=server.keepalive_timeout,
+                timeout_graceful_shutdown=args.graceful_timeout)
+
+
+if __name__ == '__main__':
+    run(parse_args())
@@ -1,19 +1,34 @@
 import asyncio
-from contextlib import ExitStack
+import contextlib
+import os
+from contextlib import ExitStack, contextmanager
 
 import httpx
 import pytest
+from fastapi import Request
 from httpx import ASGITransport
 from pytest_postgresql import factories
 import pytest_postgresql
 from pytest_postgresql.janitor import DatabaseJanitor
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection, async_sessionmaker
 
-from app.core.models.database import get_db, Base, DatabaseSessionManager
+from app.core.models.database import (get_db, Base, DatabaseSessionManager,
+                                      get_sessionmanager, get_read_db,
+                                      get_read_session_factory,
+                                      ReadSessionFactory, wants_primary)
 from app.main import app as actual_app
+from app.core.models.batcher import OrderBatcher, get_order_batcher
+from app.core.models.changes import ProductChanges, get_product_changes
+from app.core.models.cache import product_cache, search_cache
+from app.core.models.idempotency import idempotency_cache
 from app.core.models.models import Product
 from app.tests.v1.constants_for_pytest import (CREATE_INCORRECT_ORDER,
                                                CREATE_ORDER, CREATE_ORDER_ID,
-                                               CREATE_ORDER_AMOUNT, PORT_TEST)
+                                               CREATE_ORDER_AMOUNT, PORT_TEST,
+                                               PRODUCTS_FOR_LISTING,
+                                               PORT_TEST_REPLICA,
+                                               MANY_PRODUCTS)
 
 
 # Взято за основу с этой статьи:
@@ -21,6 +36,46 @@ from app.tests.v1.constants_for_pytest import (CREATE_INCORRECT_ORDER,
 
 pytest_postgresql.POSTGRESQL_BIN_DIR = '/usr/lib/postgresql/12/bin'
 
+# Под pytest-xdist у каждого воркера (gw0, gw1, ...) свой экземпляр
+# Postgres и своя база, порты сдвигаются на номер воркера.
+XDIST_WORKER = os.getenv('PYTEST_XDIST_WORKER', 'gw0')
+PORT_OFFSET = 2 * int(XDIST_WORKER.removeprefix('gw') or 0)
+# Последовательности не откатываются вместе с транзакцией теста.
+RESTART_SEQUENCES = ("SELECT setval(oid, 1, false) FROM pg_class "
+                     "WHERE relkind = 'S' "
+                     "AND relnamespace = 'public'::regnamespace")
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT',
+                        'ROLLBACK TO SAVEPOINT')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'committed: тест фиксирует транзакции по-настоящему '
+        '(несколько соединений, блокировки, LISTEN/NOTIFY); после него '
+        'таблицы очищаются TRUNCATE.')
+
+
+class TransactionalSessionManager(DatabaseSessionManager):
+    """
+    Все сессии и соединения теста работают на одном соединении внутри
+    внешней транзакции, которая откатывается после теста. commit сессии
+    фиксирует только SAVEPOINT, поэтому схема создается один раз.
+    """
+
+    def __init__(self, manager: DatabaseSessionManager,
+                 connection: AsyncConnection):
+        super().__init__()
+        self._engine = manager._engine
+        self._connection = connection
+        self._sessionmaker = async_sessionmaker(
+            autocommit=False, bind=connection,
+            join_transaction_mode='create_savepoint')
+
+    @contextlib.asynccontextmanager
+    async def connect(self):
+        async with self._connection.begin_nested():
+            yield self._connection
+
 
 @pytest.fixture(autouse=True)
 async def app():
@@ -44,50 +99,160 @@ def event_loop(request):
 
 
 warehouse_test_db = factories.postgresql_proc(
-    port=PORT_TEST, dbname='warehouse_test_db', password='password')
+    port=PORT_TEST + PORT_OFFSET,
+    dbname=f'warehouse_test_db_{XDIST_WORKER}', password='password')
 
 
-@pytest.fixture(scope='session', autouse=True)
-async def sessionmanager_fixture(warehouse_test_db):
-    # Set up the test database connection
-    pg_host = warehouse_test_db.host
-    pg_port = warehouse_test_db.port
-    pg_user = warehouse_test_db.user
-    pg_db = warehouse_test_db.dbname
-    pg_password = warehouse_test_db.password
+warehouse_replica_db = factories.postgresql_proc(
+    port=PORT_TEST_REPLICA + PORT_OFFSET,
+    dbname=f'warehouse_replica_db_{XDIST_WORKER}', password='password')
+
 
-    connection = (f'postgresql+asyncpg://{pg_user}:{pg_password}@{pg_host}'
-                  f':{pg_port}/{pg_db}')
+def database_url(proc) -> str:
+    return (f'postgresql+asyncpg://{proc.user}:{proc.password}@{proc.host}'
+            f':{proc.port}/{proc.dbname}')
 
-    sessionmanager = DatabaseSessionManager(connection, engine_kwargs={})
 
-    with DatabaseJanitor(dbname=pg_db, version=warehouse_test_db.version,
-                         host=pg_host, user=pg_user, port=pg_port,
-                         password=pg_password):
+def database_janitor(proc) -> DatabaseJanitor:
+    return DatabaseJanitor(dbname=proc.dbname, version=proc.version,
+                           host=proc.host, user=proc.user, port=proc.port,
+                           password=proc.password)
+
+
+@pytest.fixture(scope='session', autouse=True)
+async def sessionmanager_fixture(warehouse_test_db):
+    # Set up the test database connection
+    sessionmanager = DatabaseSessionManager(
+        database_url(warehouse_test_db), engine_kwargs={})
+
+    with database_janitor(warehouse_test_db):
+        # Схема создается один раз за сессию синхронным движком: у
+        # сессионной фикстуры свой цикл событий, соединения asyncpg из
+        # него непригодны в тестах.
+        engine = create_engine(database_url(warehouse_test_db).replace(
+            '+asyncpg', '+psycopg'))
+        Base.metadata.create_all(engine)
+        engine.dispose()
         yield sessionmanager
         await sessionmanager.close()
 
 
+@pytest.fixture
+async def replica_url(warehouse_replica_db):
+    # Второй экземпляр Postgres в роли реплики со своей схемой
+    with database_janitor(warehouse_replica_db):
+        replica = DatabaseSessionManager(database_url(warehouse_replica_db))
+        async with replica.connect() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        await replica.close()
+        yield database_url(warehouse_replica_db)
+
+
 @pytest.fixture(scope='function', autouse=True)
-async def create_tables(sessionmanager_fixture):
-    # Ensure that the sessionmanager is properly initialized
-    async with sessionmanager_fixture.connect() as connection:
-        await connection.run_sync(Base.metadata.drop_all)
-        await connection.run_sync(Base.metadata.create_all)
+async def database(request, sessionmanager_fixture):
+    """
+    Менеджер сессий теста. По умолчанию все изменения теста откатываются
+    вместе с внешней транзакцией; тесты с меткой committed работают
+    с настоящим менеджером, а таблицы после них очищаются.
+    """
+    product_cache.clear()
+    search_cache.clear()
+    idempotency_cache.clear()
+    if request.node.get_closest_marker('committed'):
+        async with sessionmanager_fixture.connect() as connection:
+            await connection.execute(text(RESTART_SEQUENCES))
+        yield sessionmanager_fixture
+        tables = ', '.join(table.name
+                           for table in Base.metadata.sorted_tables)
+        async with sessionmanager_fixture.connect() as connection:
+            await connection.execute(text(
+                f'TRUNCATE {tables} CASCADE'))
+        return
+    async with sessionmanager_fixture._engine.connect() as connection:
+        await connection.execute(text(RESTART_SEQUENCES))
+        yield TransactionalSessionManager(sessionmanager_fixture, connection)
+        await connection.rollback()
 
 
 @pytest.fixture(scope='function', autouse=True)
-async def session_override(app, sessionmanager_fixture):
+async def session_override(app, database):
     async def get_db_override():
-        async with sessionmanager_fixture.session() as session:
+        async with database.session() as session:
             yield session
 
     app.dependency_overrides[get_db] = get_db_override
+    app.dependency_overrides[get_read_db] = get_db_override
+    app.dependency_overrides[get_sessionmanager] = lambda: database
+
+    def get_read_session_factory_override(request: Request):
+        return ReadSessionFactory(database, wants_primary(request))
+
+    app.dependency_overrides[get_read_session_factory] = (
+        get_read_session_factory_override)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
 
 
 @pytest.fixture
-async def db_session(sessionmanager_fixture):
-    async with sessionmanager_fixture.session() as session:
+def count_queries(sessionmanager_fixture):
+    """
+    Считает SQL-запросы, выполненные движком DatabaseSessionManager
+    внутри блока `with count_queries() as counter:`. SAVEPOINT тестовой
+    транзакции не считаются: они заменяют BEGIN и COMMIT, которые
+    драйвер выполняет мимо курсора.
+    """
+    engine = sessionmanager_fixture._engine.sync_engine
+
+    @contextmanager
+    def counting():
+        counter = QueryCounter()
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if not statement.startswith(SAVEPOINT_STATEMENTS):
+                counter.statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield counter
+        finally:
+            event.remove(engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+    return counting
+
+
+@pytest.fixture
+async def order_batcher(app, database):
+    # Окно побольше, чтобы параллельные запросы теста попали в одну пачку
+    batcher = OrderBatcher(max_batch=100, window=0.05)
+    batcher.start(database)
+    app.dependency_overrides[get_order_batcher] = lambda: batcher
+    yield batcher
+    await batcher.stop()
+    del app.dependency_overrides[get_order_batcher]
+
+
+@pytest.fixture
+async def product_changes(app, database):
+    changes = ProductChanges(window=0.01)
+    changes.start(database)
+    await asyncio.wait_for(changes.wait_listening(), 5)
+    app.dependency_overrides[get_product_changes] = lambda: changes
+    yield changes
+    await changes.stop()
+    del app.dependency_overrides[get_product_changes]
+
+
+@pytest.fixture
+async def db_session(database):
+    async with database.session() as session:
         yield session
 
 
@@ -125,6 +290,27 @@ async def create_one_product(async_client):
     return product
 
 
+@pytest.fixture
+async def create_products(async_client):
+    for index, (price, amount_left) in enumerate(PRODUCTS_FOR_LISTING, 1):
+        await async_client.post('/api/v1/products/', json={
+            'name': f'ListingProduct{index}',
+            'description': 'Test Product',
+            'price': price,
+            'amount_left': amount_left
+        })
+
+
+@pytest.fixture
+async def create_many_products(db_session):
+    await db_session.execute(insert(Product), [
+        {'name': f'BudgetProduct{index}', 'description': 'Test Product',
+         'price': 10, 'amount_left': 1000}
+        for index in range(1, MANY_PRODUCTS + 1)
+    ])
+    await db_session.commit()
+
+
 @pytest.fixture
 async def post_incorrect_order(async_client):
     return async_client.post('/api/v1/orders/', json=CREATE_INCORRECT_ORDER)
@@ -20,3 +20,24 @@ CREATE_ORDER = {
   }
 }
 PORT_TEST = 5434
+PRODUCTS_FOR_LISTING = ((10.00, 5), (25.00, 3), (40.00, 1))
+PORT_TEST_REPLICA = 5435
+MANY_PRODUCTS = 25
+
+# Бюджет SQL-запросов на вызов эндпоинта. Бюджет не должен зависеть
+# от числа позиций или заказов в запросе: рост означает N+1.
+QUERY_BUDGETS = {
+    'get_products': 2,
+    'get_product': 1,
+    'search_products': 1,
+    'create_product': 1,
+    'change_product': 2,
+    'delete_product': 3,
+    'get_orders': 2,
+    'get_order': 1,
+    'create_order': 4,
+    'create_orders_batch': 5,
+    'change_order': 3,
+    'change_orders_status': 1,
+    'delete_order': 2,
+}
@@ -0,0 +1,117 @@
+import asyncio
+
+import httpx
+import pytest
+
+from fastapi import FastAPI, status
+from httpx import ASGITransport
+
+from app.core.admission import (AdmissionMiddleware, ConcurrencyLimiter,
+                                admission_rejected)
+from app.core.config import AdmissionSettings
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+def limited_app(release: asyncio.Event, **settings) -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/api/slow')
+    async def admission_slow():
+        await release.wait()
+        return {}
+
+    @app.get('/api/stream')
+    async def admission_stream():
+        await release.wait()
+        return {}
+
+    app.add_middleware(
+        AdmissionMiddleware, router=app.router,
+        settings=AdmissionSettings(exempt_routes=('admission_stream',),
+                                   **settings))
+    return app
+
+
+def client_for(app: FastAPI) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=ASGITransport(app=app),
+                             base_url='http://test')
+
+
+async def test_full_queue_fails_fast():
+    release = asyncio.Event()
+    app = limited_app(release, default_limit=1, queue_size=1,
+                      queue_timeout=5, retry_after=3)
+    rejected_before = admission_rejected.value('admission_slow',
+                                               'overloaded')
+    async with client_for(app) as client:
+        running = asyncio.create_task(client.get('/api/slow'))
+        queued = asyncio.create_task(client.get('/api/slow'))
+        await asyncio.sleep(0.05)
+
+        response = await client.get('/api/slow')
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers['Retry-After'] == '3'
+        # Исключенные маршруты не ограничиваются
+        exempt = asyncio.create_task(client.get('/api/stream'))
+
+        release.set()
+        responses = await asyncio.gather(running, queued, exempt)
+    assert [item.status_code for item in responses] == [200, 200, 200]
+    assert admission_rejected.value(
+        'admission_slow', 'overloaded') == rejected_before + 1
+
+
+async def test_queue_wait_is_bounded():
+    release = asyncio.Event()
+    app = limited_app(release, default_limit=1, queue_size=10,
+                      queue_timeout=0.05)
+    async with client_for(app) as client:
+        running = asyncio.create_task(client.get('/api/slow'))
+        await asyncio.sleep(0.01)
+        response = await client.get('/api/slow')
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        release.set()
+        assert (await running).status_code == status.HTTP_200_OK
+        # Место освобождено, очередь пуста
+        assert (await client.get('/api/slow')).status_code == 200
+
+
+async def test_release_between_timeout_and_resume():
+    limiter = ConcurrencyLimiter(limit=1, queue_size=4)
+    assert await limiter.acquire(1)
+    waiter = asyncio.create_task(limiter.acquire(0))
+    # Таймаут уже отменил ожидание, но задача еще не продолжилась
+    while not (limiter._waiters and limiter._waiters[0].cancelled()):
+        await asyncio.sleep(0)
+    limiter.release()
+    assert await waiter is False
+    assert limiter.active == limiter.queued == 0
+
+
+async def test_total_limit_caps_all_routes():
+    release = asyncio.Event()
+    app = limited_app(release, total_limit=1, default_limit=8,
+                      queue_timeout=0.05)
+    async with client_for(app) as client:
+        running = asyncio.create_task(client.get('/api/slow'))
+        await asyncio.sleep(0.01)
+        # Место маршрута есть, но общий лимит воркера занят
+        response = await client.get('/api/slow')
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        release.set()
+        assert (await running).status_code == status.HTTP_200_OK
+        assert (await client.get('/api/slow')).status_code == 200
+
+
+async def test_client_rate_limit():
+    release = asyncio.Event()
+    release.set()
+    app = limited_app(release, rate_limit=0.5, rate_burst=2)
+    async with client_for(app) as client:
+        codes = [(await client.get('/api/slow')).status_code
+                 for _ in range(3)]
+        assert codes == [200, 200, 429]
+        response = await client.get('/api/slow')
+        assert response.headers['Retry-After'] == '2'
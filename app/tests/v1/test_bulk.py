@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import pytest
+
+from fastapi import status
+
+from app.core.models import bulk
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+async def test_import_csv_upserts_by_name(async_client, create_one_product):
+    content = ('name,description,price,amount_left\n'
+               'LowStockProduct,Обновлен,60.00,7\n'
+               'NewProduct,"Новый, товар",10.50,3\n')
+    response = await async_client.post(
+        '/api/v1/products/import', content=content.encode())
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'rows': 2}
+
+    products = (await async_client.get('/api/v1/products/')).json()['items']
+    assert [(item['name'], item['amount_left']) for item in products] == [
+        ('LowStockProduct', 7), ('NewProduct', 3)]
+
+
+async def test_import_ndjson_and_export(async_client):
+    lines = [{'name': 'JsonProduct', 'description': 'a"b',
+              'price': 5.25, 'amount_left': 2}]
+    content = '\n'.join(json.dumps(line) for line in lines)
+    response = await async_client.post(
+        '/api/v1/products/import', params={'format': 'ndjson'},
+        content=content.encode())
+    assert response.json() == {'rows': 1}
+
+    exported = await async_client.get('/api/v1/products/export',
+                                      params={'format': 'ndjson'})
+    assert exported.status_code == status.HTTP_200_OK
+    row = json.loads(exported.text.splitlines()[0])
+    assert row['description'] == 'a"b'
+    assert row['amount_left'] == 2
+
+    exported = await async_client.get('/api/v1/products/export')
+    assert exported.text.splitlines()[0] == (
+        'id,name,description,price,amount_left')
+
+
+@pytest.mark.committed
+async def test_aborted_export_stops_producer(
+        async_client, database, monkeypatch):
+    content = 'name,price,amount_left\n' + ''.join(
+        f'Product{index:05d},1,1\n' for index in range(5000))
+    await async_client.post('/api/v1/products/import',
+                            content=content.encode())
+    monkeypatch.setattr(bulk, 'EXPORT_QUEUE_SIZE', 1)
+    tasks = asyncio.all_tasks()
+    export = bulk.export_products(database)
+    assert await anext(export)
+    # Производитель успевает упереться в полную очередь
+    await asyncio.sleep(0.1)
+    await export.aclose()
+    assert asyncio.all_tasks() == tasks
+
+
+async def test_import_rejects_unknown_columns(async_client):
+    response = await async_client.post(
+        '/api/v1/products/import', content=b'title,price\nfoo,1\n')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize('row', [
+    'ab,1,1',
+    f'{"x" * 256},1,1',
+    'Товар,0,1',
+    'Товар,1.005,1',
+    'Товар,1,0',
+    'Товар,,1',
+    'Товар,abc,1',
+])
+async def test_import_rejects_invalid_row(async_client, row):
+    content = f'name,price,amount_left\nХороший,1,1\n{row}\n'
+    response = await async_client.post(
+        '/api/v1/products/import', content=content.encode())
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()['detail'] == (
+        'Ошибка импорта продуктов: некорректная запись 2')
+
+    products = (await async_client.get('/api/v1/products/')).json()['items']
+    assert products == []
+
+
+async def test_import_rejects_invalid_ndjson_record(async_client):
+    content = ('{"name": "Хороший", "price": 1, "amount_left": 1}\n\n'
+               '{"name": "Плохой", "price": 1}\n')
+    response = await async_client.post(
+        '/api/v1/products/import', params={'format': 'ndjson'},
+        content=content)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()['detail'] == (
+        'Ошибка импорта продуктов: некорректная запись 2')
+
+
+async def test_import_keeps_last_duplicate(async_client):
+    content = 'name,description,price,amount_left\n' + ''.join(
+        f'Дубль,Описание,{price},1\n' for price in range(1, 50))
+    response = await async_client.post(
+        '/api/v1/products/import', content=content.encode())
+    assert response.json() == {'rows': 1}
+
+    products = (await async_client.get('/api/v1/products/')).json()['items']
+    assert [item['price'] for item in products] == [49]
@@ -0,0 +1,89 @@
+import pytest
+
+from fastapi import status
+
+from app.core.models.cache import TTLCache, product_cache
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_evicts_and_expires():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    assert cache.get(1) == 'a'
+    cache.set(3, 'c')
+    assert cache.get(2) is None
+    clock.now = 11
+    assert cache.get(1) is None
+    assert cache.stats() == {'size': 1, 'hits': 1, 'misses': 2,
+                             'evictions': 1, 'expirations': 1}
+
+
+def test_set_skipped_after_invalidation_during_read():
+    cache = TTLCache(maxsize=1, ttl=10)
+    version = cache.version()
+    cache.invalidate(1)
+    cache.set(1, 'stale', version=version)
+    assert cache.get(1) is None
+    cache.set(1, 'fresh', version=cache.version())
+    assert cache.get(1) == 'fresh'
+
+    # Сброс другого ключа не мешает, забытый сброс - мешает
+    version = cache.version()
+    cache.invalidate(2)
+    cache.set(1, 'fresh', version=version)
+    assert cache.get(1) == 'fresh'
+    cache.invalidate(3)
+    cache.set(2, 'stale', version=version)
+    assert cache.get(2) is None
+
+    version = cache.version()
+    cache.clear()
+    cache.set(1, 'stale', version=version)
+    assert cache.get(1) is None
+
+
+def test_replica_fill_skipped_within_lag():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=30, clock=clock)
+    cache.set(1, 'replica', version=cache.version(), lag=5)
+    assert cache.get(1) == 'replica'
+
+    clock.now = 100
+    cache.invalidate(1)
+    clock.now = 103
+    # Реплика могла еще не получить изменение
+    cache.set(1, 'stale', version=cache.version(), lag=5)
+    assert cache.get(1) is None
+    cache.set(1, 'primary', version=cache.version())
+    assert cache.get(1) == 'primary'
+
+    clock.now = 106
+    cache.set(1, 'replica', version=cache.version(), lag=5)
+    assert cache.get(1) == 'replica'
+    cache.clear()
+    cache.set(2, 'stale', version=cache.version(), lag=5)
+    assert cache.get(2) is None
+
+
+async def test_product_cache_invalidated_by_order(
+        create_one_product, async_client, post_order):
+    response = await async_client.get('/api/v1/products/1')
+    assert response.json()['amount_left'] == 2
+    assert product_cache.get(1)['amount_left'] == 2
+
+    response = await post_order
+    assert response.status_code == status.HTTP_201_CREATED
+    response = await async_client.get('/api/v1/products/1')
+    assert response.json()['amount_left'] == 0
@@ -0,0 +1,14 @@
+from app.core.config import DatabaseSettings, Settings
+
+
+def test_warmup_defaults_to_configured_pool_size(monkeypatch):
+    monkeypatch.setenv('DATABASE_POOL_SIZE', '40')
+    monkeypatch.delenv('DATABASE_WARMUP_CONNECTIONS', raising=False)
+    assert DatabaseSettings.from_env().warmup_connections == 40
+
+
+def test_admission_total_limit_defaults_to_pool_capacity(monkeypatch):
+    monkeypatch.setenv('DATABASE_POOL_SIZE', '12')
+    monkeypatch.setenv('DATABASE_MAX_OVERFLOW', '3')
+    monkeypatch.delenv('ADMISSION_TOTAL_LIMIT', raising=False)
+    assert Settings.from_env().admission.total_limit == 15
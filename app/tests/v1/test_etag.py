@@ -0,0 +1,39 @@
+import pytest
+
+from fastapi import status
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+async def test_product_not_modified_until_changed(
+        create_one_product, async_client, post_order):
+    response = await async_client.get('/api/v1/products/1')
+    etag = response.headers['etag']
+
+    response = await async_client.get('/api/v1/products/1',
+                                      headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b''
+
+    await post_order
+    response = await async_client.get('/api/v1/products/1',
+                                      headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['etag'] != etag
+
+
+async def test_products_list_not_modified(create_products, async_client):
+    response = await async_client.get('/api/v1/products/',
+                                      params={'limit': 2})
+    etag = response.headers['etag']
+    response = await async_client.get('/api/v1/products/',
+                                      params={'limit': 2},
+                                      headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    await async_client.delete('/api/v1/products/3')
+    response = await async_client.get('/api/v1/products/',
+                                      params={'limit': 2},
+                                      headers={'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,39 @@
+import pytest
+
+from fastapi import status
+
+from app.core.models.database import DatabaseSessionManager, get_sessionmanager
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+@pytest.fixture
+def ready(app):
+    app.state.ready = True
+    yield
+    app.state.ready = False
+
+
+async def test_liveness(async_client):
+    response = await async_client.get('/health/live')
+    assert response.status_code == status.HTTP_200_OK
+
+
+async def test_not_ready_until_lifespan_started(async_client):
+    response = await async_client.get('/health/ready')
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+async def test_ready_checks_database(ready, app, async_client):
+    response = await async_client.get('/health/ready')
+    assert response.status_code == status.HTTP_200_OK
+
+    unreachable = DatabaseSessionManager(
+        'postgresql+asyncpg://postgres@127.0.0.1:1/missing')
+    app.dependency_overrides[get_sessionmanager] = lambda: unreachable
+    try:
+        response = await async_client.get('/health/ready')
+    finally:
+        await unreachable.close()
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from fastapi import status
+from sqlalchemy import func, select, update
+
+from app.core.models.idempotency import (idempotency_cache, purge_expired,
+                                         purge_expired_periodically)
+from app.core.models.models import IdempotencyKey, Order, Product
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+KEY = {'Idempotency-Key': 'order-1'}
+
+
+async def count_orders(db_session) -> int:
+    result = await db_session.execute(select(func.count(Order.id)))
+    return result.scalar_one()
+
+
+async def test_retry_replays_stored_response(
+        create_products, async_client, db_session):
+    first = await async_client.post(
+        '/api/v1/orders/', json={'products': {'1': 2}}, headers=KEY)
+    assert first.status_code == status.HTTP_201_CREATED
+
+    # Повтор из БД, как на другом воркере
+    idempotency_cache.clear()
+    second = await async_client.post(
+        '/api/v1/orders/', json={'products': {'1': 2}}, headers=KEY)
+    assert second.status_code == status.HTTP_201_CREATED
+    assert second.json() == first.json()
+
+    assert await count_orders(db_session) == 1
+    result = await db_session.execute(
+        select(Product.amount_left).where(Product.id == 1))
+    assert result.scalar_one() == 3
+
+
+@pytest.mark.committed
+async def test_concurrent_duplicates_create_one_order(
+        create_products, async_client, db_session):
+    responses = await asyncio.gather(*(
+        async_client.post('/api/v1/orders/', json={'products': {'1': 1}},
+                          headers=KEY)
+        for _ in range(3)))
+    assert {response.status_code for response in responses} == {
+        status.HTTP_201_CREATED}
+    assert len({response.json()['id'] for response in responses}) == 1
+    assert await count_orders(db_session) == 1
+
+
+async def test_same_key_other_body_is_rejected(
+        create_products, async_client, db_session):
+    await async_client.post(
+        '/api/v1/orders/', json={'products': {'1': 1}}, headers=KEY)
+    response = await async_client.post(
+        '/api/v1/orders/', json={'products': {'2': 1}}, headers=KEY)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert await count_orders(db_session) == 1
+
+
+async def test_failed_order_is_not_remembered(
+        create_products, async_client, db_session):
+    response = await async_client.post(
+        '/api/v1/orders/', json={'products': {'999': 1}}, headers=KEY)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    result = await db_session.execute(select(func.count())
+                                      .select_from(IdempotencyKey))
+    assert result.scalar_one() == 0
+
+
+async def test_expired_keys_are_purged(
+        create_products, async_client, db_session):
+    await async_client.post(
+        '/api/v1/orders/', json={'products': {'1': 1}}, headers=KEY)
+    await db_session.execute(
+        update(IdempotencyKey)
+        .values(created_at=IdempotencyKey.created_at - func.make_interval(
+            0, 0, 0, 2)))
+    assert await purge_expired(db_session) == 1
+    await db_session.commit()
+
+    # Устаревший ключ больше не отвечает: заказ создается заново
+    idempotency_cache.clear()
+    response = await async_client.post(
+        '/api/v1/orders/', json={'products': {'1': 1}}, headers=KEY)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert await count_orders(db_session) == 2
+
+
+class BrokenManager:
+    calls = 0
+
+    def session(self):
+        self.calls += 1
+        raise ValueError('сломано')
+
+
+async def test_purge_task_logs_unexpected_errors(caplog):
+    manager = BrokenManager()
+    task = asyncio.create_task(purge_expired_periodically(manager, 0.001))
+    for _ in range(100):
+        if manager.calls >= 2:
+            break
+        await asyncio.sleep(0.01)
+    # Задача пережила ошибку и пробует снова
+    assert not task.done()
+    task.cancel()
+    assert manager.calls >= 2
+    assert 'ValueError' in caplog.text
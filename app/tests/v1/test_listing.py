@@ -0,0 +1,30 @@
+import pytest
+
+from fastapi import status
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+async def test_products_keyset_pagination(async_client, create_products):
+    first = await async_client.get('/api/v1/products/',
+                                   params={'limit': 2})
+    assert first.status_code == status.HTTP_200_OK
+    page = first.json()
+    assert [item['id'] for item in page['items']] == [1, 2]
+    assert page['next_cursor'] == 2
+
+    second = await async_client.get(
+        '/api/v1/products/', params={'limit': 2,
+                                     'cursor': page['next_cursor']})
+    page = second.json()
+    assert [item['id'] for item in page['items']] == [3]
+    assert page['next_cursor'] is None
+
+
+async def test_products_filters(async_client, create_products):
+    response = await async_client.get(
+        '/api/v1/products/', params={'price_min': 20, 'price_max': 30,
+                                     'in_stock': True})
+    assert response.status_code == status.HTTP_200_OK
+    assert [item['id'] for item in response.json()['items']] == [2]
@@ -4,7 +4,8 @@ from fastapi import status
 from sqlalchemy import select
 
 from .constants_for_pytest import INSUFFICIENT_STOCK_MESSAGE
-from app.core.models.models import Product
+from app.v1.api.constants import PRODUCT_EXISTS
+from app.core.models.models import Product, Order
 
 
 pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
@@ -17,6 +18,14 @@ async def test_insufficient_stock_and_error(
     assert INSUFFICIENT_STOCK_MESSAGE in response.json()['detail']
 
 
+async def test_rejected_order_is_not_saved(
+        post_incorrect_order, create_insufficient_stock_product, db_session):
+    response = await post_incorrect_order
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    result = await db_session.execute(select(Order))
+    assert result.scalars().all() == []
+
+
 async def test_decrease_amount_of_product(
         post_order, create_one_product, async_client, db_session):
     response = await post_order
@@ -24,3 +33,48 @@ async def test_decrease_amount_of_product(
     result = await db_session.execute(select(Product).where(Product.id == 1))
     product = result.scalar()
     assert product.amount_left == 0
+
+
+async def test_order_with_missing_product(create_one_product, async_client):
+    response = await async_client.post('/api/v1/orders/', json={
+        'products': {'1': 1, '999': 1}})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()['detail'] == 'Product с ИД 999 не найден.'
+
+
+async def test_orders_batch_rejects_only_failed_orders(
+        create_one_product, async_client, db_session):
+    response = await async_client.post('/api/v1/orders/batch', json=[
+        {'products': {'1': 2}},
+        {'products': {'1': 1}},
+        {'products': {'999': 1}},
+    ])
+    assert response.status_code == status.HTTP_200_OK
+    accepted, rejected, missing = response.json()
+    assert accepted['status_code'] == status.HTTP_201_CREATED
+    assert accepted['order']['products'] == {'1': 2}
+    assert rejected['status_code'] == status.HTTP_400_BAD_REQUEST
+    assert rejected['order'] is None
+    assert missing['status_code'] == status.HTTP_404_NOT_FOUND
+    result = await db_session.execute(select(Product).where(Product.id == 1))
+    assert result.scalar().amount_left == 0
+
+
+async def test_product_name_is_unique(create_products, async_client):
+    product = {'name': 'ListingProduct1', 'description': 'Test Product',
+               'price': 10, 'amount_left': 1}
+    response = await async_client.post('/api/v1/products/', json=product)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()['detail'] == PRODUCT_EXISTS
+
+    response = await async_client.put('/api/v1/products/2', json=product)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()['detail'] == PRODUCT_EXISTS
+
+    # Свое имя можно оставить
+    response = await async_client.put('/api/v1/products/1', json=product)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['amount_left'] == 1
+
+    response = await async_client.put('/api/v1/products/999', json=product)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
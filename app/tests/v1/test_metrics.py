@@ -0,0 +1,24 @@
+import pytest
+
+from fastapi import status
+
+from app.core.metrics import orders_created
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+async def test_metrics_report_routes_and_order_outcomes(
+        create_one_product, async_client, post_order):
+    rejected_before = orders_created.value('product_not_found')
+    await post_order
+    await async_client.post('/api/v1/orders/',
+                            json={'products': {'999': 1}})
+    assert orders_created.value('product_not_found') == rejected_before + 1
+
+    response = await async_client.get('/metrics')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/plain')
+    assert ('http_requests_total{method="POST",route="/api/v1/orders/",'
+            'status="201"}') in response.text
+    assert 'orders_created_total{outcome="success"}' in response.text
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from fastapi import status
+from sqlalchemy import select
+
+from app.core.metrics import order_batch_size
+from app.core.models.models import Order, Product
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+@pytest.mark.committed
+async def test_concurrent_orders_share_one_transaction(
+        create_products, order_batcher, async_client, db_session):
+    batches = order_batch_size.count()
+    responses = await asyncio.gather(
+        async_client.post('/api/v1/orders/', json={'products': {'1': 2}}),
+        async_client.post('/api/v1/orders/', json={'products': {'1': 2}}),
+        async_client.post('/api/v1/orders/', json={'products': {'1': 2}}),
+        async_client.post('/api/v1/orders/', json={'products': {'2': 1}}))
+    assert order_batch_size.count() == batches + 1
+
+    # Порядок заказов в пачке зависит от порядка запросов в очереди
+    codes = [response.status_code for response in responses[:3]]
+    assert sorted(codes) == [status.HTTP_201_CREATED,
+                             status.HTTP_201_CREATED,
+                             status.HTTP_400_BAD_REQUEST]
+    rejected = responses[codes.index(status.HTTP_400_BAD_REQUEST)]
+    assert 'Доступно: 1' in rejected.json()['detail']
+    assert responses[3].status_code == status.HTTP_201_CREATED
+    assert responses[3].json()['products'] == {'2': 1}
+
+    result = await db_session.execute(
+        select(Product.amount_left).order_by(Product.id))
+    assert result.scalars().all() == [1, 2, 1]
+    result = await db_session.execute(select(Order.id))
+    assert len(result.scalars().all()) == 3
+
+
+@pytest.mark.committed
+async def test_missing_product_rejects_only_its_order(
+        create_one_product, order_batcher, async_client):
+    responses = await asyncio.gather(
+        async_client.post('/api/v1/orders/', json={'products': {'999': 1}}),
+        async_client.post('/api/v1/orders/', json={'products': {'1': 1}}))
+    assert [response.status_code for response in responses] == [
+        status.HTTP_404_NOT_FOUND, status.HTTP_201_CREATED]
+
+
+@pytest.mark.committed
+async def test_submit_during_stop_is_saved(create_one_product, order_batcher):
+    stopping = asyncio.create_task(order_batcher.stop())
+    await asyncio.sleep(0)
+    assert not order_batcher.running
+    # Заказ после начала остановки не зависает за _STOP в очереди
+    result = await asyncio.wait_for(
+        order_batcher.submit({'status': 'в процессе', 'products': {1: 1}}),
+        timeout=5)
+    await stopping
+    assert result['status_code'] == status.HTTP_201_CREATED
@@ -0,0 +1,80 @@
+import datetime
+import json
+
+import pytest
+
+from fastapi import status
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+
+from app.core.models.crud import order_filters
+from app.core.models.models import Order
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+# Месяц заказов: около 70 в час, 1000 продуктов.
+ORDERS = 50000
+PRODUCTS = 1000
+
+
+@pytest.fixture
+async def order_history(db_session):
+    await db_session.execute(text(
+        "INSERT INTO products (name, price, amount_left) "
+        "SELECT 'FilterProduct' || g, 10, 1000 "
+        "FROM generate_series(1, :products) AS g"), {'products': PRODUCTS})
+    await db_session.execute(text(
+        "INSERT INTO orders (status, created_at) "
+        "SELECT (ARRAY['в процессе', 'отправлен', 'доставлен'])[1 + g % 3], "
+        "now() - (g % 43200) * interval '1 minute' "
+        "FROM generate_series(1, :orders) AS g"), {'orders': ORDERS})
+    await db_session.execute(text(
+        "INSERT INTO order_items (order_id, product_id, amount_of_product) "
+        "SELECT g, 1 + g % :products, 1 "
+        "FROM generate_series(1, :orders) AS g"),
+        {'orders': ORDERS, 'products': PRODUCTS})
+    await db_session.commit()
+    await db_session.execute(text('ANALYZE products, orders, order_items'))
+
+
+async def explain(db_session, **filters) -> str:
+    # Тот же запрос, что строит get_orders для первой страницы
+    statement = (select(Order.id).where(*order_filters(**filters))
+                 .order_by(Order.id).limit(101))
+    compiled = statement.compile(
+        dialect=postgresql.dialect(paramstyle='named'))
+    result = await db_session.execute(
+        text(f'EXPLAIN (FORMAT JSON) {compiled}'), compiled.params)
+    return json.dumps(result.scalar())
+
+
+async def test_status_and_period_use_composite_index(
+        order_history, db_session):
+    hour_ago = (datetime.datetime.now(datetime.UTC)
+                - datetime.timedelta(hours=1))
+    plan = await explain(db_session, order_status='в процессе',
+                         created_from=hour_ago)
+    assert 'ix_orders_status_created_at' in plan
+
+
+async def test_product_filter_uses_product_index(order_history, db_session):
+    plan = await explain(db_session, product_id=7)
+    assert 'ix_order_items_product_id' in plan
+
+
+async def test_orders_filtered_by_product(
+        create_products, async_client):
+    await async_client.post('/api/v1/orders/batch', json=[
+        {'products': {'1': 1}},
+        {'products': {'2': 1, '3': 1}},
+        {'products': {'1': 1, '2': 1}},
+    ])
+    response = await async_client.get('/api/v1/orders/',
+                                      params={'product_id': 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert [item['id'] for item in response.json()['items']] == [2, 3]
+
+    response = await async_client.get(
+        '/api/v1/orders/', params={'product_id': 1, 'status': 'отправлен'})
+    assert response.json()['items'] == []
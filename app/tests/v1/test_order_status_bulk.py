@@ -0,0 +1,58 @@
+import pytest
+
+from fastapi import status
+from sqlalchemy import select
+
+from app.core.models.models import Order
+from app.v1.api.constants import STATUS_TARGET_REQUIRED
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+STATUS_URL = '/api/v1/orders/status'
+
+
+@pytest.fixture
+async def create_orders(create_products, async_client):
+    await async_client.post('/api/v1/orders/batch', json=[
+        {'products': {'1': 1}},
+        {'products': {'2': 1}},
+        {'products': {'1': 1, '2': 1}},
+    ])
+
+
+async def statuses(db_session):
+    result = await db_session.execute(
+        select(Order.status).order_by(Order.id))
+    return result.scalars().all()
+
+
+async def test_bulk_status_by_ids_reports_missing(
+        create_orders, async_client, db_session):
+    response = await async_client.patch(STATUS_URL, json={
+        'status': 'отправлен', 'ids': [3, 1, 404, 1]})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'updated': 2, 'not_found': [404]}
+    assert await statuses(db_session) == [
+        'отправлен', 'в процессе', 'отправлен']
+
+
+async def test_bulk_status_by_filter(create_orders, async_client,
+                                     db_session):
+    response = await async_client.patch(STATUS_URL, json={
+        'status': 'доставлен', 'filter': {'product_id': 2}})
+    assert response.json() == {'updated': 2, 'not_found': []}
+    assert await statuses(db_session) == [
+        'в процессе', 'доставлен', 'доставлен']
+
+
+@pytest.mark.parametrize('body', [
+    {'status': 'отправлен'},
+    {'status': 'отправлен', 'filter': {}},
+    {'status': 'отправлен', 'ids': [1], 'filter': {'product_id': 1}},
+])
+async def test_bulk_status_needs_one_target(create_orders, async_client,
+                                            body):
+    response = await async_client.patch(STATUS_URL, json=body)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()['detail'] == STATUS_TARGET_REQUIRED
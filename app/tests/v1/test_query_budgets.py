@@ -0,0 +1,91 @@
+import pytest
+
+from fastapi import status
+
+from .constants_for_pytest import QUERY_BUDGETS, MANY_PRODUCTS
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+PRODUCT = {'name': 'BudgetNew', 'description': 'Test Product',
+           'price': 1, 'amount_left': 1}
+
+
+def order_with_lines(lines: int) -> dict:
+    return {'products': {str(index): 1 for index in range(1, lines + 1)}}
+
+
+async def assert_within_budget(count_queries, name, request):
+    with count_queries() as counter:
+        response = await request
+    assert response.status_code < status.HTTP_400_BAD_REQUEST, response.text
+    assert counter.count <= QUERY_BUDGETS[name], counter.statements
+    return response
+
+
+@pytest.mark.parametrize('lines', [1, 10, MANY_PRODUCTS])
+async def test_create_order_budget(
+        create_many_products, async_client, count_queries, lines):
+    await assert_within_budget(
+        count_queries, 'create_order',
+        async_client.post('/api/v1/orders/', json=order_with_lines(lines)))
+
+
+@pytest.mark.parametrize('orders', [1, 10])
+async def test_create_orders_batch_budget(
+        create_many_products, async_client, count_queries, orders):
+    await assert_within_budget(
+        count_queries, 'create_orders_batch',
+        async_client.post('/api/v1/orders/batch',
+                          json=[order_with_lines(MANY_PRODUCTS)] * orders))
+
+
+@pytest.mark.parametrize('orders', [1, 500])
+async def test_get_orders_budget(
+        create_many_products, async_client, count_queries, orders):
+    await async_client.post('/api/v1/orders/batch',
+                            json=[order_with_lines(2)] * orders)
+    response = await assert_within_budget(
+        count_queries, 'get_orders',
+        async_client.get('/api/v1/orders/', params={'limit': orders}))
+    items = response.json()['items']
+    assert len(items) == orders
+    assert all(item['products'] == {'1': 1, '2': 1} for item in items)
+
+
+async def test_order_endpoints_budget(
+        create_many_products, async_client, count_queries):
+    for _ in range(3):
+        await async_client.post('/api/v1/orders/',
+                                json=order_with_lines(MANY_PRODUCTS))
+    calls = {
+        'get_orders': async_client.get('/api/v1/orders/'),
+        'get_order': async_client.get('/api/v1/orders/1'),
+        'change_order': async_client.patch(
+            '/api/v1/orders/1/status', json={'status': 'отправлен'}),
+        'change_orders_status': async_client.patch(
+            '/api/v1/orders/status',
+            json={'status': 'доставлен', 'ids': [1, 2, 3]}),
+        'delete_order': async_client.delete('/api/v1/orders/2'),
+    }
+    for name, request in calls.items():
+        await assert_within_budget(count_queries, name, request)
+
+
+async def test_product_endpoints_budget(
+        create_many_products, async_client, count_queries):
+    await async_client.post('/api/v1/orders/',
+                            json=order_with_lines(MANY_PRODUCTS))
+    calls = {
+        'get_products': async_client.get('/api/v1/products/'),
+        'get_product': async_client.get('/api/v1/products/1'),
+        'search_products': async_client.get('/api/v1/products/search',
+                                            params={'q': 'BudgetProduct1'}),
+        'create_product': async_client.post('/api/v1/products/',
+                                            json=PRODUCT),
+        'change_product': async_client.put(
+            '/api/v1/products/2', json={**PRODUCT, 'name': 'BudgetPut'}),
+        'delete_product': async_client.delete('/api/v1/products/3'),
+    }
+    for name, request in calls.items():
+        await assert_within_budget(count_queries, name, request)
@@ -0,0 +1,101 @@
+import pytest
+
+from fastapi import status
+
+from app.core.models import crud
+from app.core.models.cache import search_cache
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+SEARCH_URL = '/api/v1/products/search'
+PRODUCTS = (
+    ('Чайник электрический', 'Стальной корпус'),
+    ('Заварочный чайник', 'Фарфор'),
+    ('Кружка', 'Подходит к чайнику'),
+    ('Электрочайник mini', 'Компактный'),
+    ('Сковорода', 'Антипригарное покрытие'),
+)
+
+
+@pytest.fixture
+async def create_search_products(async_client):
+    for name, description in PRODUCTS:
+        await async_client.post('/api/v1/products/', json={
+            'name': name, 'description': description,
+            'price': 100, 'amount_left': 10})
+
+
+async def test_search_ranks_name_prefix_first(
+        create_search_products, async_client):
+    response = await async_client.get(SEARCH_URL, params={'q': 'чайник'})
+    assert response.status_code == status.HTTP_200_OK
+    names = [item['name'] for item in response.json()['items']]
+    # Начало названия, затем слово в названии, затем подстрока
+    assert names == ['Чайник электрический', 'Заварочный чайник',
+                     'Электрочайник mini']
+
+    response = await async_client.get(SEARCH_URL, params={'q': 'фарфор'})
+    assert [item['name'] for item in response.json()['items']] == [
+        'Заварочный чайник']
+
+
+async def test_search_pages_by_cursor(create_search_products, async_client):
+    first = await async_client.get(SEARCH_URL,
+                                   params={'q': 'чайник', 'limit': 2})
+    cursor = first.json()['next_cursor']
+    assert cursor is not None
+    second = await async_client.get(
+        SEARCH_URL, params={'q': 'чайник', 'limit': 2, 'cursor': cursor})
+    assert second.json()['next_cursor'] is None
+    names = [item['name'] for page in (first, second)
+             for item in page.json()['items']]
+    assert len(names) == len(set(names)) == 3
+
+    response = await async_client.get(
+        SEARCH_URL, params={'q': 'чайник', 'cursor': 'abc'})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+async def test_search_cache_is_reset_by_catalog_changes(
+        create_search_products, async_client):
+    await async_client.get(SEARCH_URL, params={'q': 'сковорода'})
+    assert len(search_cache) == 1
+    await async_client.post('/api/v1/products/', json={
+        'name': 'Сковорода гриль', 'description': 'Чугун',
+        'price': 100, 'amount_left': 1})
+    assert len(search_cache) == 0
+
+    response = await async_client.get(SEARCH_URL, params={'q': 'сковорода'})
+    assert len(response.json()['items']) == 2
+
+
+async def test_like_wildcards_are_literal(
+        create_search_products, async_client):
+    response = await async_client.get(SEARCH_URL, params={'q': '%%'})
+    assert response.json()['items'] == []
+
+
+async def test_candidates_are_picked_by_relevance(
+        create_search_products, async_client, monkeypatch):
+    for name, description in (('Нож', 'металл'),
+                              ('Вилка', 'металл металл металл')):
+        await async_client.post('/api/v1/products/', json={
+            'name': name, 'description': description,
+            'price': 100, 'amount_left': 10})
+    monkeypatch.setattr(crud, 'MAX_SEARCH_CANDIDATES', 1)
+    response = await async_client.get(SEARCH_URL, params={'q': 'металл'})
+    # Кандидат - самое релевантное совпадение, а не самое старое
+    assert [item['name'] for item in response.json()['items']] == [
+        'Вилка']
+    assert response.json()['next_cursor'] is None
+
+
+async def test_short_query_skips_substring_search(
+        create_search_products, async_client):
+    # 'mi' - только подстрока слова mini, по словам совпадений нет
+    response = await async_client.get(SEARCH_URL, params={'q': 'mi'})
+    assert response.json()['items'] == []
+    response = await async_client.get(SEARCH_URL, params={'q': 'min'})
+    assert [item['name'] for item in response.json()['items']] == [
+        'Электрочайник mini']
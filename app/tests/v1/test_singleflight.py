@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from fastapi import status
+
+from app.core.models.singleflight import (SingleFlight, coalesced_reads,
+                                          read_flight)
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+READERS = 10
+
+
+async def test_concurrent_reads_share_one_query(
+        create_one_product, post_order, async_client, count_queries):
+    await post_order
+    leaders_before = coalesced_reads.value('order', 'leader')
+    with count_queries() as counter:
+        responses = await asyncio.gather(*(
+            async_client.get('/api/v1/orders/1') for _ in range(READERS)))
+    assert {response.status_code for response in responses} == {
+        status.HTTP_200_OK}
+    assert len({response.text for response in responses}) == 1
+    # В БД ходят только leader, остальные получают их результат
+    leaders = coalesced_reads.value('order', 'leader') - leaders_before
+    assert counter.count == leaders < READERS
+    assert len(read_flight) == 0
+
+
+async def test_not_found_is_shared(async_client, count_queries):
+    with count_queries() as counter:
+        responses = await asyncio.gather(*(
+            async_client.get('/api/v1/orders/999') for _ in range(READERS)))
+    assert {response.status_code for response in responses} == {
+        status.HTTP_404_NOT_FOUND}
+    assert counter.count < READERS
+
+
+async def test_leader_cancellation_does_not_cancel_followers():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = 0
+
+    async def read():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return 42
+
+    leader = asyncio.create_task(flight.do(('test', 1), read))
+    follower = asyncio.create_task(flight.do(('test', 1), read))
+    await asyncio.sleep(0)
+    leader.cancel()
+    release.set()
+    assert await follower == 42
+    assert calls == 1
+    assert len(flight) == 0
+
+
+async def test_product_list_reads_etag_and_page_together(
+        create_products, async_client, count_queries):
+    leaders_before = coalesced_reads.value('products', 'leader')
+    with count_queries() as counter:
+        responses = await asyncio.gather(*(
+            async_client.get('/api/v1/products/') for _ in range(READERS)))
+    assert {response.status_code for response in responses} == {
+        status.HTTP_200_OK}
+    # Каждый leader читает ETag и страницу в одной сессии
+    leaders = coalesced_reads.value('products', 'leader') - leaders_before
+    assert counter.count == 2 * leaders < 2 * READERS
+
+
+@pytest.mark.committed
+async def test_primary_reads_are_not_coalesced(
+        create_one_product, async_client):
+    before = (coalesced_reads.value('product', 'leader')
+              + coalesced_reads.value('product', 'follower'))
+    responses = await asyncio.gather(*(
+        async_client.get('/api/v1/products/1',
+                         headers={'X-Read-Primary': '1'})
+        for _ in range(READERS)))
+    assert {response.status_code for response in responses} == {
+        status.HTTP_200_OK}
+    assert (coalesced_reads.value('product', 'leader')
+            + coalesced_reads.value('product', 'follower')) == before
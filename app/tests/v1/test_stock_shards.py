@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from fastapi import status
+from sqlalchemy import select
+
+from app.core.models.models import Product, ProductStockShard
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+
+async def create_sharded_product(async_client, amount_left, shards):
+    await async_client.post('/api/v1/products/', json={
+        'name': 'HotProduct', 'description': 'Test Product',
+        'price': 10, 'amount_left': amount_left})
+    return await async_client.put('/api/v1/products/1/shards',
+                                  json={'shards': shards})
+
+
+async def stock_rows(db_session):
+    result = await db_session.execute(
+        select(ProductStockShard.amount).order_by(ProductStockShard.shard))
+    shards = result.scalars().all()
+    result = await db_session.execute(select(Product.amount_left))
+    return result.scalar(), shards
+
+
+async def test_enable_and_disable_shards(async_client, db_session):
+    response = await create_sharded_product(async_client, 10, 4)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['amount_left'] == 10
+    assert await stock_rows(db_session) == (0, [3, 3, 2, 2])
+
+    response = await async_client.put('/api/v1/products/1/shards',
+                                      json={'shards': 0})
+    assert response.json()['amount_left'] == 10
+    assert await stock_rows(db_session) == (10, [])
+
+
+async def test_order_takes_one_shard(async_client, db_session):
+    await create_sharded_product(async_client, 10, 4)
+    response = await async_client.post('/api/v1/orders/', json={
+        'products': {'1': 2}})
+    assert response.status_code == status.HTTP_201_CREATED
+    amount_left, shards = await stock_rows(db_session)
+    assert amount_left == 0
+    assert sorted(shards) == [1, 2, 2, 3] or sorted(shards) == [0, 2, 3, 3]
+    response = await async_client.get('/api/v1/products/1')
+    assert response.json()['amount_left'] == 8
+
+
+async def test_order_larger_than_any_shard_rebalances(
+        async_client, db_session):
+    await create_sharded_product(async_client, 10, 4)
+    response = await async_client.post('/api/v1/orders/', json={
+        'products': {'1': 5}})
+    assert response.status_code == status.HTTP_201_CREATED
+    assert await stock_rows(db_session) == (0, [2, 1, 1, 1])
+
+    response = await async_client.post('/api/v1/orders/', json={
+        'products': {'1': 6}})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'Доступно: 5, Запрошено: 6' in response.json()['detail']
+
+
+async def test_put_product_resets_sharded_stock(async_client, db_session):
+    await create_sharded_product(async_client, 10, 4)
+    response = await async_client.put('/api/v1/products/1', json={
+        'name': 'ColdProduct', 'description': 'Test Product',
+        'price': 10, 'amount_left': 3})
+    assert response.json()['amount_left'] == 3
+    assert await stock_rows(db_session) == (3, [0, 0, 0, 0])
+
+
+@pytest.mark.committed
+async def test_concurrent_orders_do_not_oversell(async_client, db_session):
+    await create_sharded_product(async_client, 20, 4)
+    responses = await asyncio.gather(*(
+        async_client.post('/api/v1/orders/', json={'products': {'1': 1}})
+        for _ in range(25)))
+    codes = []
+    for response in responses:
+        # Пока шарды заняты, заказ отклоняется с 409 и повторяется
+        while response.status_code == status.HTTP_409_CONFLICT:
+            assert response.headers['Retry-After']
+            response = await async_client.post(
+                '/api/v1/orders/', json={'products': {'1': 1}})
+        codes.append(response.status_code)
+    assert codes.count(status.HTTP_201_CREATED) == 20
+    assert codes.count(status.HTTP_400_BAD_REQUEST) == 5
+    amount_left, shards = await stock_rows(db_session)
+    assert amount_left + sum(shards) == 0
+
+
+@pytest.mark.committed
+async def test_busy_shard_is_retryable_conflict(
+        async_client, database):
+    await create_sharded_product(async_client, 10, 4)
+    async with database.session() as holder:
+        # Параллельный заказ держит один шард
+        await holder.execute(
+            select(ProductStockShard).where(ProductStockShard.shard == 0)
+            .with_for_update())
+        response = await async_client.post('/api/v1/orders/', json={
+            'products': {'1': 10}})
+        await holder.rollback()
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.headers['Retry-After'] == '1'
+
+    response = await async_client.post('/api/v1/orders/', json={
+        'products': {'1': 10}})
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+async def test_orders_batch_uses_sharded_stock(async_client, db_session):
+    await create_sharded_product(async_client, 10, 4)
+    response = await async_client.post('/api/v1/orders/batch', json=[
+        {'products': {'1': 3}},
+        {'products': {'1': 3}},
+        {'products': {'1': 5}},
+    ])
+    codes = [result['status_code'] for result in response.json()]
+    assert codes == [status.HTTP_201_CREATED, status.HTTP_201_CREATED,
+                     status.HTTP_400_BAD_REQUEST]
+    assert await stock_rows(db_session) == (0, [1, 1, 1, 1])
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import pytest
+
+from fastapi import status
+from sqlalchemy import text
+
+from app.core.models.cache import product_cache
+from app.core.models.changes import ProductChanges, product_events
+
+
+pytest.mark.asyncio = pytest.mark.asyncio(loop_scope='function')
+
+STREAM_URL = '/api/v1/products/stream'
+
+
+@pytest.mark.committed
+async def test_order_pushes_new_stock(
+        create_products, product_changes, async_client):
+    subscription = product_changes.subscribe([2])
+    await async_client.post('/api/v1/orders/',
+                            json={'products': {'1': 1, '2': 2}})
+    reset, changes = await subscription.get(2)
+    # Подписка только на продукт 2
+    assert not reset
+    assert changes == [{'id': 2, 'amount_left': 1, 'price': 25.0}]
+
+
+@pytest.mark.committed
+async def test_put_and_delete_are_streamed(
+        create_products, product_changes, async_client):
+    subscription = product_changes.subscribe()
+    response = await async_client.put('/api/v1/products/2', json={
+        'name': 'Товар', 'description': 'Описание',
+        'price': 25, 'amount_left': 7})
+    assert response.status_code == status.HTTP_200_OK
+    _, changes = await subscription.get(2)
+    assert changes == [{'id': 2, 'amount_left': 7, 'price': 25.0}]
+
+    await async_client.delete('/api/v1/products/2')
+    _, changes = await subscription.get(2)
+    assert changes == [{'id': 2, 'deleted': True}]
+
+
+@pytest.mark.committed
+async def test_notify_invalidates_worker_cache(product_changes, db_session):
+    # Запись на другом воркере приходит только уведомлением
+    product_cache.set(1, {'id': 1})
+    await db_session.execute(text("SELECT pg_notify('product_changes', '1')"))
+    await db_session.commit()
+    for _ in range(100):
+        if product_cache.get(1) is None:
+            break
+        await asyncio.sleep(0.01)
+    assert product_cache.get(1) is None
+
+
+@pytest.mark.committed
+async def test_listener_does_not_hold_pool_connection(
+        product_changes, database):
+    # LISTEN идет по отдельному соединению, пул остается запросам
+    assert database._engine.pool.checkedout() == 0
+
+
+async def test_events_are_formatted_as_sse():
+    changes = ProductChanges()
+    events = product_events(changes, [1], keepalive=0.01)
+    assert await anext(events) == b': connected\n\n'
+    assert await anext(events) == b': ping\n\n'
+
+    change = {'id': 1, 'amount_left': 4, 'price': 10.0}
+    changes._subscribers.copy().pop().push({1: change, 2: {'id': 2}}, True)
+    assert await anext(events) == b'event: reset\ndata: {}\n\n'
+    event = await anext(events)
+    assert event.startswith(b'event: stock\ndata: ')
+    assert json.loads(event.split(b'data: ')[1]) == change
+
+    await events.aclose()
+    assert not changes._subscribers
+
+
+async def test_stream_unavailable_without_listener(async_client):
+    response = await async_client.get(STREAM_URL)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
@@ -1,100 +1,473 @@
-from typing import List
+import datetime
+from decimal import Decimal
+from typing import List, Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from fastapi import Depends, status
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from fastapi import (Body, Depends, Header, Query, Request, Response,
+                     status)
+from fastapi.responses import StreamingResponse
 from fastapi.exceptions import HTTPException
 from pydantic import ValidationError
 
-from app.core.models.models import Order, Product, OrderItem
+from app.core.models.models import (Order, Product, OrderItem,
+                                    ProductStockShard)
 from app.core.schemas.schema import (OrderGet, ProductGet, OrderStatusUpdate,
-                                     ProductCreateUpdate, OrderCreate)
+                                     ProductCreateUpdate, OrderCreate,
+                                     ProductPage, OrderPage, OrderBatchResult,
+                                     ProductImportResult, ProductShardsUpdate,
+                                     ProductSearchPage, OrderStatusBulkUpdate,
+                                     OrderStatusBulkResult)
+from .constants import (DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT, REGEX,
+                        DESCRIPTION_CURSOR, DESCRIPTION_STATUS,
+                        MAX_BATCH_ORDERS, DESCRIPTION_FORMAT,
+                        DESCRIPTION_IDEMPOTENCY_KEY, DESCRIPTION_SEARCH,
+                        DESCRIPTION_SEARCH_CURSOR, SEARCH_CURSOR_PATTERN,
+                        PRODUCT_EXISTS, DESCRIPTION_PRODUCT,
+                        STATUS_TARGET_REQUIRED, STREAM_UNAVAILABLE,
+                        STREAM_KEEPALIVE, DESCRIPTION_STREAM_PRODUCTS)
 from .endpoints import products, orders
-from app.core.models.database import get_db
-from app.core.models.crud import (get_or_404, filter_name,
-                                  check_product_amount_and_save)
+from app.core.metrics import orders_created
+from app.core.models.batcher import OrderBatcher, get_order_batcher
+from app.core.models.changes import (ProductChanges, get_product_changes,
+                                     product_events)
+from app.core.models.cache import (product_cache, search_cache,
+                                   invalidate_after_commit)
+from app.core.models.idempotency import (idempotency_cache, request_hash,
+                                         single_flight, find_response,
+                                         remember_response, replay)
+from app.core.models.bulk import FORMATS, import_products, export_products
+from app.core.models.database import (get_db, get_read_db,
+                                      get_sessionmanager,
+                                      get_read_session_factory,
+                                      DatabaseSessionManager,
+                                      ReadSessionFactory, replica_lag,
+                                      wants_primary)
+from app.core.models.singleflight import read_once
+from app.core.models.crud import (get_or_404, product_exists, paginate,
+                                  check_product_amount_and_save,
+                                  save_orders_batch, etag_matches,
+                                  object_etag, collection_etag,
+                                  order_outcome, set_stock_shards,
+                                  search_products, not_found,
+                                  order_snapshot, order_filters,
+                                  set_orders_status)
 
+# Поля ProductGet, которые отдают INSERT и UPDATE ... RETURNING.
+PRODUCT_COLUMNS = (Product.id, Product.name, Product.description,
+                   Product.price, Product.amount_left)
 
-@products.get('/', response_model=List[ProductGet], status_code=200)
-async def get_products(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Product).order_by(Product.id))
-    return result.scalars().all()
+
+@products.get('/', response_model=ProductPage, status_code=200)
+async def get_products(
+        request: Request,
+        response: Response,
+        limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+        cursor: Optional[int] = Query(None, ge=0,
+                                      description=DESCRIPTION_CURSOR),
+        price_min: Optional[Decimal] = Query(None, ge=0),
+        price_max: Optional[Decimal] = Query(None, ge=0),
+        in_stock: bool = Query(False, description='Только товары в наличии'),
+        if_none_match: Optional[str] = Header(None),
+        sessions: ReadSessionFactory = Depends(get_read_session_factory)):
+    """
+    Список продуктов. Если каталог не менялся с момента, когда клиент
+    получил ETag, отвечает 304 без выборки страницы. Одинаковые
+    одновременные запросы (те же параметры и If-None-Match) делят одно
+    чтение: ETag и страница читаются в одной сессии.
+    """
+    sharded_stock = select(
+        func.coalesce(func.sum(ProductStockShard.amount), 0)
+    ).scalar_subquery()
+    query_string = request.url.query
+    statement = select(Product)
+    if price_min is not None:
+        statement = statement.where(Product.price >= price_min)
+    if price_max is not None:
+        statement = statement.where(Product.price <= price_max)
+    if in_stock:
+        statement = statement.where(Product.amount_available > 0)
+
+    async def read(db: AsyncSession):
+        etag = await collection_etag(db=db, model=Product,
+                                     query_string=query_string,
+                                     extra=[sharded_stock])
+        if etag_matches(if_none_match, etag):
+            return etag, None
+        return etag, await paginate(db=db, model=Product,
+                                    statement=statement,
+                                    limit=limit, cursor=cursor)
+
+    etag, page = await read_once(
+        ('products', query_string, if_none_match), sessions, read)
+    if page is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers={'ETag': etag})
+    response.headers['ETag'] = etag
+    return page
 
 
 @products.post('/', response_model=ProductGet, status_code=201)
 async def create_product(
         product: ProductCreateUpdate, db: AsyncSession = Depends(get_db)):
-    new_product = Product(**product.model_dump())
-    await filter_name(db=db, model=Product, item=product, statement=select)
-    db.add(new_product)
+    """
+    Одна вставка: занятое имя отсекает ON CONFLICT по unique_name,
+    ответ собирается из RETURNING без повторного чтения.
+    """
+    result = await db.execute(
+        insert(Product).values(**product.model_dump())
+        .on_conflict_do_nothing(index_elements=[Product.name])
+        .returning(*PRODUCT_COLUMNS))
+    new_product = result.mappings().one_or_none()
+    if new_product is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=PRODUCT_EXISTS)
+    invalidate_after_commit(db, search_cache)
     await db.commit()
-    await db.refresh(new_product)
     return new_product
 
 
+@products.post('/import', response_model=ProductImportResult,
+               status_code=200)
+async def import_products_file(
+        request: Request,
+        file_format: str = Query('csv', alias='format',
+                                 pattern='^(' + '|'.join(FORMATS) + ')$',
+                                 description=DESCRIPTION_FORMAT),
+        db: AsyncSession = Depends(get_db)):
+    """
+    Массовая загрузка продуктов. Тело запроса читается потоком и
+    передается в БД через COPY; продукты с существующим именем обновляются.
+    """
+    rows = await import_products(db=db, chunks=request.stream(),
+                                 file_format=file_format)
+    await db.commit()
+    return {'rows': rows}
+
+
+@products.get('/export', status_code=200)
+async def export_products_file(
+        file_format: str = Query('csv', alias='format',
+                                 pattern='^(' + '|'.join(FORMATS) + ')$',
+                                 description=DESCRIPTION_FORMAT),
+        manager: DatabaseSessionManager = Depends(get_sessionmanager)):
+    media_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(
+        export_products(sessionmanager=manager, file_format=file_format),
+        media_type=media_type)
+
+
+@products.get('/stream', status_code=200)
+async def stream_products(
+        product_id: Optional[List[int]] = Query(
+            None, description=DESCRIPTION_STREAM_PRODUCTS),
+        changes: Optional[ProductChanges] = Depends(get_product_changes)):
+    """
+    Изменения остатков и цен в формате server-sent events вместо опроса
+    списка продуктов. Событие stock - новое состояние продукта
+    (deleted - продукт удален), reset - нужно перечитать каталог.
+    """
+    if changes is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail=STREAM_UNAVAILABLE)
+    return StreamingResponse(
+        product_events(changes, product_id, keepalive=STREAM_KEEPALIVE),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@products.get('/search', response_model=ProductSearchPage, status_code=200)
+async def search_products_page(
+        request: Request,
+        q: str = Query(min_length=2, max_length=255,
+                       description=DESCRIPTION_SEARCH),
+        limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+        cursor: Optional[str] = Query(None, pattern=SEARCH_CURSOR_PATTERN,
+                                      description=DESCRIPTION_SEARCH_CURSOR),
+        db: AsyncSession = Depends(get_read_db)):
+    """
+    Поиск продуктов по названию и описанию с ранжированием.
+    Популярные запросы отдаются из кэша воркера: изменения каталога
+    его сбрасывают, остатки могут отставать на SEARCH_CACHE_TTL секунд.
+    Чтение с реплики не попадает в кэш, если каталог менялся в пределах
+    ее отставания; клиент, читающий после своей записи с primary,
+    кэш не использует.
+    """
+    key = (q.strip().lower(), limit, cursor)
+    page = None if wants_primary(request) else search_cache.get(key)
+    if page is None:
+        version = search_cache.version()
+        page = await search_products(db=db, model=Product, query=q.strip(),
+                                     limit=limit, cursor=cursor)
+        search_cache.set(key, page, version=version, lag=replica_lag(db))
+    return page
+
+
 @products.get('/{product_id}', response_model=ProductGet, status_code=200)
-async def get_product(product_id: int, db: AsyncSession = Depends(get_db)):
-    return await get_or_404(db=db, model=Product, identifier=product_id)
+async def get_product(
+        product_id: int, response: Response,
+        if_none_match: Optional[str] = Header(None),
+        sessions: ReadSessionFactory = Depends(get_read_session_factory)):
+    """
+    Одновременные запросы одного продукта, не найденного в кэше, ждут
+    одно чтение из БД; соединение берет только первый из них.
+    """
+    # Клиент после своей записи читает с primary мимо кэша
+    product = None if sessions.primary else product_cache.get(product_id)
+    if product is None:
+        product = await read_once(
+            ('product', product_id), sessions,
+            lambda db: get_or_404(db=db, model=Product,
+                                  identifier=product_id, cache=product_cache,
+                                  fresh=sessions.primary))
+    etag = object_etag(product)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers={'ETag': etag})
+    response.headers['ETag'] = etag
+    return product
 
 
 @products.put('/{product_id}', response_model=ProductGet, status_code=200)
 async def change_product(product_id: int, new_product: ProductCreateUpdate,
                          db: AsyncSession = Depends(get_db)):
-    product = await get_or_404(db=db, model=Product, identifier=product_id)
-    await filter_name(db=db, model=Product, item=new_product, statement=select)
-    product.name = new_product.name
-    product.price = new_product.price
-    product.description = new_product.description
-    product.amount_left = new_product.amount_left
+    """
+    Один UPDATE ... RETURNING. Новый остаток задается целиком: шарды
+    обнуляются в том же запросе, первый же заказ разложит остаток по
+    ним заново. Занятое имя - 400 по нарушению unique_name.
+    """
+    cleared = (
+        update(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id,
+               ProductStockShard.amount != 0)
+        .values(amount=0)
+        .returning(ProductStockShard.shard)
+        .cte('cleared_shards')
+    )
+    # Условие с подзапросом к cleared_shards вычисляется до блокировки
+    # строки products: шарды блокируются первыми, как у заказов.
+    statement = (
+        update(Product)
+        .where(Product.id == product_id,
+               select(func.count()).select_from(cleared)
+               .scalar_subquery() >= 0)
+        .values(**new_product.model_dump())
+        .returning(*PRODUCT_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        result = await db.execute(statement)
+    except IntegrityError as error:
+        raise product_exists(error)
+    product = result.mappings().one_or_none()
+    if product is None:
+        raise not_found(Product, product_id)
+    invalidate_after_commit(db, product_cache, [product_id])
+    invalidate_after_commit(db, search_cache)
     await db.commit()
-    await db.refresh(product)
     return product
 
 
+@products.put('/{product_id}/shards', response_model=ProductGet,
+              status_code=200)
+async def change_product_shards(product_id: int,
+                                shards: ProductShardsUpdate,
+                                db: AsyncSession = Depends(get_db)):
+    """
+    Делит остаток популярного продукта на несколько строк, чтобы
+    параллельные заказы не выстраивались в очередь за блокировкой
+    одной строки. shards=0 возвращает остаток в одну строку.
+    """
+    await set_stock_shards(db=db, model=Product, product_id=product_id,
+                           shards=shards.shards)
+    await db.commit()
+    return await get_or_404(db=db, model=Product, identifier=product_id)
+
+
 @products.delete('/{product_id}', status_code=204)
 async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
     product = await get_or_404(db=db, model=Product, identifier=product_id)
     await db.delete(product)
+    invalidate_after_commit(db, product_cache, [product_id])
+    invalidate_after_commit(db, search_cache)
     await db.commit()
 
 
-@orders.get('/', response_model=List[OrderGet], status_code=200)
-async def get_orders(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Order).order_by(Order.id))
-    return result.scalars().all()
+@orders.get('/', response_model=OrderPage, status_code=200)
+async def get_orders(
+        limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+        cursor: Optional[int] = Query(None, ge=0,
+                                      description=DESCRIPTION_CURSOR),
+        order_status: Optional[str] = Query(None, alias='status',
+                                            pattern=REGEX,
+                                            description=DESCRIPTION_STATUS),
+        created_from: Optional[datetime.datetime] = None,
+        created_to: Optional[datetime.datetime] = None,
+        product_id: Optional[int] = Query(None, ge=1,
+                                          description=DESCRIPTION_PRODUCT),
+        sessions: ReadSessionFactory = Depends(get_read_session_factory)):
+    """
+    Список заказов с позициями. Позиции всей страницы догружаются
+    одним запросом (selectinload по id заказов страницы), поэтому
+    число запросов не зависит от limit. Одинаковые одновременные
+    запросы делят одну выборку.
+    """
+    statement = select(Order).where(*order_filters(
+        order_status=order_status, created_from=created_from,
+        created_to=created_to, product_id=product_id,
+    )).options(
+        selectinload(Order.order_items).load_only(
+            OrderItem.product_id, OrderItem.amount_of_product))
+
+    async def read_page(db: AsyncSession):
+        page = await paginate(db=db, model=Order, statement=statement,
+                              limit=limit, cursor=cursor)
+        return {**page, 'items': [order_snapshot(order)
+                                  for order in page['items']]}
+
+    return await read_once(
+        ('orders', limit, cursor, order_status, created_from, created_to,
+         product_id), sessions, read_page)
 
 
 @orders.get('/{order_id}', response_model=OrderGet, status_code=200)
-async def get_order(order_id: int, db: AsyncSession = Depends(get_db)):
-    order = await get_or_404(
-        db=db, model=Order, join_load=True, identifier=order_id)
-    return order
+async def get_order(
+        order_id: int,
+        sessions: ReadSessionFactory = Depends(get_read_session_factory)):
+    return await read_once(
+        ('order', order_id), sessions,
+        lambda db: get_or_404(db=db, model=Order, join_load=True,
+                              identifier=order_id))
+
+
+async def save_order(
+        db: AsyncSession,
+        order: OrderCreate,
+        idempotency_key: Optional[str] = None,
+        fingerprint: Optional[str] = None):
+    """
+    Сохраняет заказ в одной транзакции. С idempotency_key в ту же
+    транзакцию записывается ответ, чтобы повтор запроса его вернул.
+    """
+    result = await db.execute(
+        insert(Order).values(status=order.status)
+        .returning(Order.id, Order.created_at))
+    new_order = result.one()
+
+    try:
+        await check_product_amount_and_save(
+            db=db, model=Product, save_model=OrderItem,
+            product_dict=order.products, order_id=new_order.id)
+    except HTTPException as error:
+        orders_created.inc(order_outcome(error.status_code))
+        raise
+    response = {
+        'id': new_order.id,
+        'created_at': new_order.created_at,
+        'status': order.status,
+        'products': order.products
+    }
+    if idempotency_key is not None:
+        stored = await remember_response(db, idempotency_key, fingerprint,
+                                         response)
+        if stored is None:
+            # Тот же ключ успел зафиксировать другой воркер
+            await db.rollback()
+            stored = await find_response(db, idempotency_key)
+            return replay(stored, fingerprint)
+    await db.commit()
+    if idempotency_key is not None:
+        idempotency_cache.set(idempotency_key, stored)
+    orders_created.inc(order_outcome(status.HTTP_201_CREATED))
+    return response
 
 
 @orders.post('/', response_model=OrderGet, status_code=201)
-async def create_order(order: OrderCreate,
-                       db: AsyncSession = Depends(get_db)):
+async def create_order(
+        order: OrderCreate,
+        db: AsyncSession = Depends(get_db),
+        batcher: Optional[OrderBatcher] = Depends(get_order_batcher),
+        idempotency_key: Optional[str] = Header(
+            None, max_length=255, description=DESCRIPTION_IDEMPOTENCY_KEY)):
     """
     Создание нового заказа. Проверяет наличие товаров на
     складе, добавляет заказ и связанные с ним товары в
     базу данных, после чего возвращает созданный заказ.
+    Все выполняется в одной транзакции: при нехватке товара
+    заказ не сохраняется, ответ собирается без повторного чтения.
+    При включенной групповой фиксации (ORDER_BATCHING) заказ
+    сохраняется в общей транзакции с другими заказами воркера.
+    С заголовком Idempotency-Key повтор возвращает сохраненный ответ,
+    а параллельный повтор ждет завершения первого запроса; такие
+    заказы сохраняются отдельной транзакцией.
+    """
+    if idempotency_key is not None:
+        fingerprint = request_hash(order.model_dump())
+        async with single_flight(idempotency_key):
+            stored = await find_response(db, idempotency_key)
+            if stored is not None:
+                return replay(stored, fingerprint)
+            return await save_order(db, order, idempotency_key,
+                                    fingerprint)
+
+    if batcher is not None:
+        result = await batcher.submit(order.model_dump())
+        orders_created.inc(order_outcome(result['status_code']))
+        if result['status_code'] != status.HTTP_201_CREATED:
+            raise HTTPException(status_code=result['status_code'],
+                                detail=result['detail'],
+                                headers=result['headers'])
+        return result['order']
+    return await save_order(db, order)
+
+
+@orders.post('/batch', response_model=List[OrderBatchResult],
+             status_code=200)
+async def create_orders_batch(
+        orders_batch: List[OrderCreate] = Body(
+            min_length=1, max_length=MAX_BATCH_ORDERS),
+        db: AsyncSession = Depends(get_db)):
+    """
+    Пакетное создание заказов. Все заказы сохраняются в одной транзакции,
+    для каждого возвращается свой результат: заказы, которым не хватило
+    товара, отклоняются и не мешают остальным.
+    """
+    results = await save_orders_batch(
+        db=db, model=Product, save_model=OrderItem, order_model=Order,
+        orders=[order.model_dump() for order in orders_batch])
+    await db.commit()
+    for result in results:
+        orders_created.inc(order_outcome(result['status_code']))
+    return results
+
+
+@orders.patch('/status', response_model=OrderStatusBulkResult,
+              status_code=200)
+async def change_orders_status(change: OrderStatusBulkUpdate,
+                               db: AsyncSession = Depends(get_db)):
+    """
+    Массовая смена статуса: по списку ids (до MAX_STATUS_ORDERS) или
+    по фильтру, как в списке заказов. Одним UPDATE; для списка
+    возвращаются id, которых нет в базе.
     """
-    order_dict = order.model_dump()
-    products_dict = order_dict.get('products')
-    new_order = Order(
-        created_at=order_dict.get('created_at'),
-        status=order_dict.get('status'))
-    db.add(new_order)
+    criteria = []
+    if change.filter is not None:
+        criteria = order_filters(
+            order_status=change.filter.status,
+            created_from=change.filter.created_from,
+            created_to=change.filter.created_to,
+            product_id=change.filter.product_id)
+    if (change.ids is None) == (not criteria):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=STATUS_TARGET_REQUIRED)
+    updated, missing = await set_orders_status(
+        db=db, model=Order, new_status=change.status, ids=change.ids,
+        criteria=criteria)
     await db.commit()
-    await db.refresh(new_order)
-
-    await check_product_amount_and_save(
-        db=db, model=Product, save_model=OrderItem,
-        product_dict=products_dict, order_id=new_order.id)
-    await db.refresh(new_order)
-    new_order_products = await get_or_404(db=db, model=Order, join_load=True,
-                                          identifier=new_order.id)
-    return new_order_products
+    return {'updated': updated, 'not_found': missing}
 
 
 @orders.patch('/{order_id}/status', response_model=OrderGet, status_code=200)
@@ -6,3 +6,41 @@ DESCRIPTION_PRODUCTS = 'Сопоставление идентификаторо
 REGEX = '^(' + '|'.join(ALLOWED_STATUSES) + ')$'
 DESCRIPTION_AMOUNT_PRODUCTS = 'Продуктов должно быть больше или равно 1'
 DESCRIPTION_STATUS = ', '.join(ALLOWED_STATUSES)
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+DESCRIPTION_CURSOR = ('ИД последнего элемента предыдущей страницы '
+                      '(значение next_cursor из прошлого ответа).')
+MAX_BATCH_ORDERS = 10000
+IMPORT_ERROR = 'Ошибка импорта продуктов: {}'
+IMPORT_ROW_ERROR = IMPORT_ERROR.format('некорректная запись {}')
+DESCRIPTION_FORMAT = 'Формат файла: csv (с заголовком) или ndjson'
+MAX_STOCK_SHARDS = 256
+DESCRIPTION_SHARDS = ('На сколько строк разделить остаток продукта, '
+                      '0 - хранить остаток в одной строке.')
+# Товар не хватает, пока часть шардов держат параллельные заказы.
+STOCK_BUSY = ('Остаток {} (ID: {}) сейчас резервируют другие заказы, '
+              'повторите запрос.')
+STOCK_BUSY_RETRY_AFTER = 1
+IDEMPOTENCY_MISMATCH = ('Idempotency-Key уже использован '
+                        'с другим телом запроса.')
+DESCRIPTION_IDEMPOTENCY_KEY = ('Повтор запроса с тем же ключом вернет '
+                               'сохраненный ответ, не создавая заказ заново.')
+# Сколько совпадений каждого вида ранжируется при поиске.
+MAX_SEARCH_CANDIDATES = 1000
+# С подстрокой короче трех символов pg_trgm не использует индекс.
+MIN_SUBSTRING_SEARCH = 3
+DESCRIPTION_SEARCH = ('Слова из названия или описания; также ищется '
+                      f'подстрока в названии (от {MIN_SUBSTRING_SEARCH} '
+                      'символов). Ранжируются до '
+                      f'{MAX_SEARCH_CANDIDATES} самых релевантных '
+                      'совпадений каждого вида, дальше выдача '
+                      'заканчивается.')
+DESCRIPTION_SEARCH_CURSOR = 'Значение next_cursor из прошлого ответа поиска.'
+SEARCH_CURSOR_PATTERN = r'^\d+(\.\d+)?(e-\d+)?:\d+$'
+DESCRIPTION_PRODUCT = 'Только заказы, в которых есть этот продукт.'
+MAX_STATUS_ORDERS = 100000
+STATUS_TARGET_REQUIRED = 'Укажите либо ids, либо непустой filter.'
+STREAM_UNAVAILABLE = 'Поток изменений продуктов не запущен.'
+STREAM_KEEPALIVE = 15.0
+DESCRIPTION_STREAM_PRODUCTS = ('Только изменения этих продуктов; '
+                               'по умолчанию все.')
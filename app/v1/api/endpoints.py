@@ -11,3 +11,5 @@ orders = APIRouter(
     tags=['orders'],
     responses={404: {'description': 'Not found'}},
 )
+
+service = APIRouter(tags=['service'])
@@ -0,0 +1,49 @@
+import asyncio
+
+from fastapi import Depends, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.core.metrics import registry
+from app.core.models.database import (DatabaseSessionManager,
+                                      get_sessionmanager)
+from .endpoints import service
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Сколько секунд ждать ответа БД в проверке готовности.
+READY_DATABASE_TIMEOUT = 2.0
+
+
+@service.get('/metrics', response_class=PlainTextResponse,
+             include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(),
+                             media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@service.get('/health/live', include_in_schema=False)
+async def liveness():
+    """Процесс жив и его цикл событий отвечает; БД не проверяется."""
+    return {'status': 'ok'}
+
+
+@service.get('/health/ready', include_in_schema=False)
+async def readiness(
+        request: Request,
+        manager: DatabaseSessionManager = Depends(get_sessionmanager)):
+    """
+    Воркер готов принимать трафик: lifespan прогрел пул и еще не начал
+    остановку, а primary отвечает на запрос.
+    """
+    if not getattr(request.app.state, 'ready', False):
+        return JSONResponse({'status': 'starting'},
+                            status.HTTP_503_SERVICE_UNAVAILABLE)
+    try:
+        async with asyncio.timeout(READY_DATABASE_TIMEOUT):
+            async with manager.connect() as connection:
+                await connection.execute(text('SELECT 1'))
+    except (OSError, DBAPIError, asyncio.TimeoutError):
+        return JSONResponse({'status': 'database unavailable'},
+                            status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {'status': 'ok'}
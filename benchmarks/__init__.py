@@ -0,0 +1,7 @@
+import os
+
+# Сценарии меряют обработчики и БД, а не отказы AdmissionMiddleware: иначе
+# часть клиентов сразу получает 503 и повторяет запрос по кругу. Настройки
+# читаются при импорте app, поэтому значение ставится до него.
+# ADMISSION_ENABLED=true в окружении включает ограничение обратно.
+os.environ.setdefault('ADMISSION_ENABLED', 'false')
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import platform
+import sys
+
+from benchmarks.database import local_postgres, seed
+from benchmarks.runner import (asgi_client, git_revision, run_scenario,
+                               uvicorn_client)
+from benchmarks.scenarios import SCENARIOS, Workload
+
+TRANSPORTS = ('asgi', 'uvicorn')
+
+
+async def run(args: argparse.Namespace, url: str) -> dict:
+    workload = Workload(products=args.products, orders=args.orders,
+                        lines_per_order=args.lines_per_order)
+    if not args.skip_seed:
+        print(f'Засеиваем: {args.products} продуктов, {args.orders} заказов',
+              file=sys.stderr)
+        await seed(url, args.products, args.orders, args.items_per_order)
+
+    if args.transport == 'asgi':
+        client_context = asgi_client(url, args.pool_size,
+                                     args.order_batching)
+    else:
+        client_context = uvicorn_client(url, args.workers, args.concurrency,
+                                        args.order_batching)
+
+    results = {}
+    async with client_context as client:
+        for name in args.scenarios:
+            print(f'Сценарий {name}...', file=sys.stderr)
+            results[name] = await run_scenario(
+                client, SCENARIOS[name], workload,
+                concurrency=args.concurrency, duration=args.duration,
+                warmup=args.warmup, seed=args.seed)
+    return {
+        'started_at': datetime.datetime.now(
+            datetime.timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'parameters': {
+            'transport': args.transport,
+            'workers': args.workers if args.transport == 'uvicorn' else 1,
+            'concurrency': args.concurrency,
+            'order_batching': args.order_batching,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'products': args.products,
+            'orders': args.orders,
+            'items_per_order': args.items_per_order,
+            'lines_per_order': args.lines_per_order,
+            'seed': args.seed,
+        },
+        'scenarios': results,
+    }
+
+
+async def main(args: argparse.Namespace):
+    if args.database_url:
+        database = contextlib.nullcontext(args.database_url)
+    else:
+        database = local_postgres(args.pg_ctl, args.port)
+    with database as url:
+        report = await run(args, url)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Нагрузочные сценарии для каталога и заказов.')
+    parser.add_argument('--database-url',
+                        help='Готовая БД (postgresql+asyncpg://...); '
+                             'без него поднимается временный Postgres')
+    parser.add_argument('--pg-ctl', default='pg_ctl',
+                        help='Путь к pg_ctl для временного Postgres')
+    parser.add_argument('--port', type=int, default=5436,
+                        help='Порт временного Postgres')
+    parser.add_argument('--skip-seed', action='store_true',
+                        help='Не пересоздавать схему и данные')
+    parser.add_argument('--products', type=int, default=100_000)
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--items-per-order', type=int, default=3,
+                        help='Позиций в каждом засеянном заказе')
+    parser.add_argument('--lines-per-order', type=int, default=2,
+                        help='Позиций в заказах, создаваемых в сценарии')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument('--transport', choices=TRANSPORTS, default='asgi')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Воркеров uvicorn для --transport uvicorn')
+    parser.add_argument('--pool-size', type=int, default=20,
+                        help='Размер пула для --transport asgi')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--order-batching', action='store_true',
+                        help='Групповая фиксация заказов (ORDER_BATCHING)')
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='Секунд измерения на сценарий')
+    parser.add_argument('--warmup', type=float, default=3.0,
+                        help='Секунд прогрева перед измерением')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='-',
+                        help='Файл для JSON-отчета, "-" для stdout')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
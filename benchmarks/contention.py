@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+
+from app.core.models.crud import set_stock_shards
+from app.core.models.database import DatabaseSessionManager
+from app.core.models.models import Product
+from benchmarks.database import HOT_PRODUCT_ID, local_postgres, seed
+from benchmarks.runner import asgi_client, git_revision, run_scenario
+from benchmarks.scenarios import SCENARIOS, Workload
+
+
+async def shard_hot_product(url: str, shards: int):
+    manager = DatabaseSessionManager(url)
+    try:
+        async with manager.session() as session:
+            await set_stock_shards(db=session, model=Product,
+                                   product_id=HOT_PRODUCT_ID, shards=shards)
+            await session.commit()
+    finally:
+        await manager.close()
+
+
+async def run(args: argparse.Namespace, url: str) -> dict:
+    """
+    Один и тот же поток заказов на горячий товар: сначала остаток
+    в одной строке products, затем разнесенный по шардам.
+    """
+    workload = Workload(products=args.products, orders=args.products,
+                        lines_per_order=args.lines_per_order)
+    await seed(url, args.products, args.products, 1)
+    results = {}
+    for shards in (0, args.shards):
+        await shard_hot_product(url, shards)
+        label = 'single_row' if shards == 0 else f'sharded_{shards}'
+        print(f'Сценарий {args.scenario}, {label}...', file=sys.stderr)
+        async with asgi_client(url, args.pool_size) as client:
+            results[label] = await run_scenario(
+                client, SCENARIOS[args.scenario], workload,
+                concurrency=args.concurrency, duration=args.duration,
+                warmup=args.warmup, seed=args.seed)
+    return {
+        'revision': git_revision(),
+        'parameters': vars(args),
+        'scenarios': results,
+    }
+
+
+async def main(args: argparse.Namespace):
+    if args.database_url:
+        database = contextlib.nullcontext(args.database_url)
+    else:
+        database = local_postgres(args.pg_ctl, args.port)
+    with database as url:
+        report = await run(args, url)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.contention',
+        description='Заказы на один товар: остаток в одной строке '
+                    'против остатка, разнесенного по шардам.')
+    parser.add_argument('--database-url')
+    parser.add_argument('--pg-ctl', default='pg_ctl')
+    parser.add_argument('--port', type=int, default=5436)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--shards', type=int, default=64)
+    parser.add_argument('--scenario', default='hot_order',
+                        choices=('hot_order', 'order_creation'))
+    parser.add_argument('--lines-per-order', type=int, default=2)
+    parser.add_argument('--pool-size', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,86 @@
+import contextlib
+import os
+import tempfile
+from decimal import Decimal
+from typing import Iterator
+
+from pytest_postgresql.executor import PostgreSQLExecutor
+from pytest_postgresql.janitor import DatabaseJanitor
+from sqlalchemy import text
+
+from app.core.models.database import Base, DatabaseSessionManager
+from app.core.models import models  # noqa: F401 - регистрирует таблицы
+from app.v1.api.constants import ALLOWED_STATUSES
+
+HOT_PRODUCT_ID = 1
+# Запас товара, которого хватит на любой прогон, чтобы заказы не
+# отклонялись и в измерения попадала именно конкуренция за строку.
+UNLIMITED_STOCK = 1_000_000_000
+
+
+@contextlib.contextmanager
+def local_postgres(pg_ctl: str, port: int,
+                   dbname: str = 'warehouse_bench') -> Iterator[str]:
+    """
+    Поднимает временный экземпляр Postgres тем же способом, что и
+    pytest-postgresql в тестах, и возвращает URL для asyncpg.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        executor = PostgreSQLExecutor(
+            executable=pg_ctl, host='127.0.0.1', port=port,
+            datadir=os.path.join(directory, 'data'),
+            unixsocketdir=directory,
+            logfile=os.path.join(directory, 'postgresql.log'),
+            startparams='-w', dbname=dbname,
+            postgres_options='-c max_connections=500')
+        with executor:
+            executor.wait_for_postgres()
+            with DatabaseJanitor(user=executor.user, host=executor.host,
+                                 port=executor.port,
+                                 version=executor.version, dbname=dbname,
+                                 password=executor.password):
+                yield (f'postgresql+asyncpg://{executor.user}:'
+                       f'{executor.password}@{executor.host}:'
+                       f'{executor.port}/{dbname}')
+
+
+async def seed(url: str, products: int, orders: int,
+               items_per_order: int, stock: int = UNLIMITED_STOCK):
+    """
+    Пересоздает схему и наполняет ее: продукты через COPY,
+    заказы и позиции одним INSERT ... SELECT generate_series на таблицу.
+    """
+    items_per_order = min(items_per_order, products)
+    manager = DatabaseSessionManager(url)
+    try:
+        async with manager.connect() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+            await connection.run_sync(Base.metadata.create_all)
+
+        async with manager.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                'products',
+                columns=('name', 'description', 'price', 'amount_left'),
+                records=((f'SKU-{index:09d}', f'Товар {index}',
+                          Decimal(index % 10000 + 1) / 100, stock)
+                         for index in range(1, products + 1)))
+            await connection.execute(text(
+                'INSERT INTO orders (status, created_at) '
+                'SELECT (CAST(:statuses AS varchar[]))[1 + g % 3], '
+                "now() - (g % 43200) * interval '1 minute' "
+                'FROM generate_series(1, :orders) AS g'
+            ), {'statuses': list(ALLOWED_STATUSES), 'orders': orders})
+            await connection.execute(text(
+                'INSERT INTO order_items '
+                '(order_id, product_id, amount_of_product) '
+                'SELECT o, 1 + (o + k * :step) % :products, 1 '
+                'FROM generate_series(1, :orders) AS o, '
+                'generate_series(1, :items) AS k'
+            ), {'products': products, 'items': items_per_order,
+                'step': products // items_per_order, 'orders': orders})
+        async with manager.connect() as connection:
+            await connection.execute(text('ANALYZE'))
+    finally:
+        await manager.close()
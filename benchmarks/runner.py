@@ -0,0 +1,179 @@
+import asyncio
+import contextlib
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import AsyncIterator, Dict, List
+
+import httpx
+
+from benchmarks.scenarios import Request, Workload
+
+PERCENTILES = (50, 95, 99)
+READY_URL = '/health/ready'
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """Перцентиль методом ближайшего ранга по отсортированному списку."""
+    if not values:
+        return 0.0
+    index = max(math.ceil(rank / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+def summarize(latencies: List[float], errors: int,
+              elapsed: float) -> Dict[str, float]:
+    """
+    latencies - задержки только успешных запросов: быстрые отказы
+    (409, 429, 503) не завышают RPS и не занижают перцентили.
+    Ошибки и их доля считаются отдельно.
+    """
+    latencies = sorted(latencies)
+    requests = len(latencies) + errors
+    summary = {
+        'requests': requests,
+        'errors': errors,
+        'error_rate': round(errors / requests, 4) if requests else 0.0,
+        'throughput_rps': round(len(latencies) / elapsed, 2)
+        if elapsed else 0.0,
+    }
+    for rank in PERCENTILES:
+        summary[f'p{rank}_ms'] = round(percentile(latencies, rank) * 1000, 3)
+    return summary
+
+
+async def run_scenario(client: httpx.AsyncClient, request: Request,
+                       workload: Workload, concurrency: int,
+                       duration: float, warmup: float = 0.0,
+                       seed: int = 0) -> Dict[str, float]:
+    """
+    Запускает concurrency клиентов, каждый шлет запросы подряд, пока не
+    выйдет время. Первые warmup секунд в статистику не попадают.
+    Ошибкой считается исключение httpx или статус ответа >= 400;
+    в RPS и задержки идут только успешные запросы.
+    """
+    latencies: List[float] = []
+    errors = 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def client_loop(number: int):
+        nonlocal errors
+        rng = random.Random(seed * 100003 + number)
+        while (start := time.perf_counter()) < deadline:
+            try:
+                response = await request(client, rng, workload)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if start < measure_from:
+                continue
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client_loop(number)
+                           for number in range(concurrency)))
+    return summarize(latencies, errors,
+                     time.perf_counter() - max(measure_from, started))
+
+
+@contextlib.asynccontextmanager
+async def asgi_client(url: str, pool_size: int,
+                      order_batching: bool = False) -> AsyncIterator[
+        httpx.AsyncClient]:
+    """
+    Приложение в том же процессе через ASGITransport: без сети и
+    сериализации HTTP, видна стоимость самих обработчиков и SQL.
+    """
+    from app.core.config import settings
+    from app.core.metrics import InstrumentedQueuePool
+    from app.core.models.batcher import order_batcher
+    from app.core.models.database import sessionmanager
+    from app.main import app
+
+    engine_kwargs = {**settings.database.engine_kwargs(),
+                     'pool_size': pool_size,
+                     'poolclass': InstrumentedQueuePool}
+    sessionmanager.init(url, engine_kwargs)
+    try:
+        await sessionmanager.warmup(pool_size)
+        if order_batching:
+            order_batcher.start(
+                sessionmanager, max_batch=settings.order_batch_size,
+                window=settings.order_batch_window_ms / 1000)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://bench') as client:
+            yield client
+    finally:
+        await order_batcher.stop()
+        await sessionmanager.close()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def uvicorn_client(url: str, workers: int, concurrency: int,
+                         order_batching: bool = False,
+                         startup_timeout: float = 60.0) -> AsyncIterator[
+        httpx.AsyncClient]:
+    """
+    Запускает uvicorn с несколькими воркерами в отдельном процессе и
+    ждет, пока он начнет отвечать.
+    """
+    port = free_port()
+    environment = {**os.environ, 'DATABASE_URL': url}
+    if order_batching:
+        environment['ORDER_BATCHING'] = '1'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app',
+         '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning',
+         '--no-access-log'],
+        env=environment)
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}',
+                                     limits=limits,
+                                     timeout=30.0) as client:
+            deadline = time.monotonic() + startup_timeout
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError('uvicorn завершился при запуске')
+                try:
+                    if (await client.get(READY_URL)).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError('uvicorn не ответил за '
+                                       f'{startup_timeout} с')
+                await asyncio.sleep(0.2)
+            yield client
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
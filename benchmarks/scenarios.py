@@ -0,0 +1,84 @@
+import random
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict
+
+import httpx
+
+from app.v1.api.constants import ALLOWED_STATUSES
+from benchmarks.database import HOT_PRODUCT_ID
+
+PRODUCTS_URL = '/api/v1/products/'
+ORDERS_URL = '/api/v1/orders/'
+
+
+@dataclass(frozen=True)
+class Workload:
+    """Объем данных, засеянных в базу: из него сценарии берут id."""
+    products: int
+    orders: int
+    page_limit: int = 100
+    lines_per_order: int = 2
+
+
+Request = Callable[[httpx.AsyncClient, random.Random, Workload],
+                   Awaitable[httpx.Response]]
+
+
+async def catalog_listing(client: httpx.AsyncClient, rng: random.Random,
+                          workload: Workload) -> httpx.Response:
+    """Страница каталога со случайного места (keyset-курсор)."""
+    cursor = rng.randrange(max(workload.products - workload.page_limit, 1))
+    return await client.get(PRODUCTS_URL, params={
+        'limit': workload.page_limit, 'cursor': cursor})
+
+
+async def single_lookup(client: httpx.AsyncClient, rng: random.Random,
+                        workload: Workload) -> httpx.Response:
+    """Карточка случайного продукта."""
+    product_id = rng.randint(1, workload.products)
+    return await client.get(f'{PRODUCTS_URL}{product_id}')
+
+
+async def product_search(client: httpx.AsyncClient, rng: random.Random,
+                         workload: Workload) -> httpx.Response:
+    """Поиск случайного артикула: кэш поиска почти не помогает."""
+    product_id = rng.randint(1, workload.products)
+    return await client.get(f'{PRODUCTS_URL}search', params={
+        'q': f'SKU-{product_id:09d}', 'limit': 20})
+
+
+async def order_creation(client: httpx.AsyncClient, rng: random.Random,
+                         workload: Workload) -> httpx.Response:
+    """
+    Заказ, в котором всегда есть горячий продукт HOT_PRODUCT_ID:
+    все клиенты конкурируют за блокировку одной строки.
+    """
+    products = {HOT_PRODUCT_ID: 1}
+    while len(products) < min(workload.lines_per_order, workload.products):
+        products[rng.randint(1, workload.products)] = 1
+    return await client.post(ORDERS_URL, json={'products': products})
+
+
+async def hot_order(client: httpx.AsyncClient, rng: random.Random,
+                    workload: Workload) -> httpx.Response:
+    """Заказ только горячего продукта: чистая конкуренция за остаток."""
+    return await client.post(ORDERS_URL, json={
+        'products': {HOT_PRODUCT_ID: 1}})
+
+
+async def status_updates(client: httpx.AsyncClient, rng: random.Random,
+                         workload: Workload) -> httpx.Response:
+    """Смена статуса случайного заказа."""
+    order_id = rng.randint(1, workload.orders)
+    return await client.patch(f'{ORDERS_URL}{order_id}/status', json={
+        'status': rng.choice(ALLOWED_STATUSES)})
+
+
+SCENARIOS: Dict[str, Request] = {
+    'catalog_listing': catalog_listing,
+    'single_lookup': single_lookup,
+    'product_search': product_search,
+    'order_creation': order_creation,
+    'hot_order': hot_order,
+    'status_updates': status_updates,
+}